@@ -30,21 +30,13 @@ contract EarnMock is Earn {
     }
 
     function setLastOperateRound(uint256 value) external {
-        roundTag = value;
+        roundTag = uint32(value);
     }
 
     function setReduceTime(uint256 value) external {
         ReduceTime = value;
     }
 
-    function setUnDelegateValidatorState(bool value) external {
-        unDelegateValidatorState = value;
-    }
-
-    function setUnDelegateValidatorIndex(uint256 value) external {
-        unDelegateValidatorIndex = value;
-    }
-
     function getCurrentRound() external view returns (uint256) {
         return ICandidateHub(CANDIDATE_HUB).getRoundTag();
     }
@@ -0,0 +1,104 @@
+pragma solidity 0.8.4;
+
+import "../interface/IPledgeAgent.sol";
+import "../lib/IterableAddressDelegateMapping.sol";
+import "../lib/Structs.sol";
+
+import "@openzeppelin/contracts-upgradeable/proxy/utils/Initializable.sol";
+import "@openzeppelin/contracts-upgradeable/access/Ownable2StepUpgradeable.sol";
+import "@openzeppelin/contracts-upgradeable/proxy/utils/UUPSUpgradeable.sol";
+import "@openzeppelin/contracts-upgradeable/security/ReentrancyGuardUpgradeable.sol";
+import "@openzeppelin/contracts-upgradeable/security/PausableUpgradeable.sol";
+
+// Storage layout of the first version of the mock Earn contract, used to test upgrading to {EarnMock}
+contract EarnV1Mock is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradeable, PausableUpgradeable, UUPSUpgradeable {
+    uint256 private constant RATE_BASE = 1000000;
+
+    address public CANDIDATE_HUB;
+    address public PLEDGE_AGENT;
+    uint256 public DAY_INTERVAL;
+
+    address public STCORE;
+    uint256[] public exchangeRates;
+    IterableAddressDelegateMapping.LegacyMap private validatorDelegateMap;
+    uint256 public lockDay;
+    mapping(address => RedeemRecord[]) public redeemRecords;
+    uint256 public balanceThreshold;
+    uint256 public mintMinLimit;
+    uint256 public redeemMinLimit;
+    uint256 public pledgeAgentLimit;
+    uint256 public protocolFeePoints;
+    address public protocolFeeReceiver;
+    address public operator;
+    uint256 public roundTag;
+    uint256 public redeemCountLimit;
+    uint256 public exchangeRateQueryLimit;
+    uint256 public toWithdrawAmount;
+
+    uint256[50] private __gap;
+
+    function initialize(address _stCore, address _protocolFeeReceiver, address _operator) external initializer {
+        __Ownable2Step_init();
+        __UUPSUpgradeable_init();
+        __ReentrancyGuard_init();
+        __Pausable_init();
+
+        STCORE = _stCore;
+        protocolFeeReceiver = _protocolFeeReceiver;
+        operator = _operator;
+
+        exchangeRates.push(RATE_BASE);
+        lockDay = 7;
+        balanceThreshold = 10000 ether;
+        mintMinLimit = 1 ether;
+        redeemMinLimit = 1 ether;
+        pledgeAgentLimit = 1 ether;
+        protocolFeePoints = 0;
+        redeemCountLimit = 100;
+        exchangeRateQueryLimit = 365;
+        toWithdrawAmount = 0;
+    }
+
+    function developmentInit() external {
+        balanceThreshold = balanceThreshold / 1e20;
+        mintMinLimit = mintMinLimit / 1e16;
+        redeemMinLimit = redeemMinLimit / 1e16;
+        pledgeAgentLimit = pledgeAgentLimit / 1e16;
+    }
+
+    function setContractAddress(address candidateAddress, address pledgeAgentAddress, uint256 _roundTag) external {
+        CANDIDATE_HUB = candidateAddress;
+        PLEDGE_AGENT = pledgeAgentAddress;
+        roundTag = _roundTag;
+    }
+
+    function setProtocolFeePoints(uint256 value) external {
+        protocolFeePoints = value;
+    }
+
+    function delegate(address validator) external payable {
+        IPledgeAgent(PLEDGE_AGENT).delegateCoin{value: msg.value}(validator);
+        if (validatorDelegateMap.indexOf[validator] == 0) {
+            validatorDelegateMap.keys.push(validator);
+            validatorDelegateMap.indexOf[validator] = validatorDelegateMap.keys.length;
+        }
+        validatorDelegateMap.values[validator] += msg.value;
+    }
+
+    function pushExchangeRate(uint256 rate) external {
+        exchangeRates.push(rate);
+    }
+
+    function pushRedeemRecord(address account, uint256 unlockTime, uint256 amount) external {
+        redeemRecords[account].push(RedeemRecord({
+            redeemTime: block.timestamp,
+            unlockTime: unlockTime,
+            amount: amount,
+            stCore: amount,
+            protocolFee: 0
+        }));
+        toWithdrawAmount += amount;
+    }
+
+    function _authorizeUpgrade(address newImplementation) internal onlyOwner override {}
+}
@@ -0,0 +1,36 @@
+pragma solidity 0.8.4;
+
+contract RoundLimitPledgeAgent {
+    // Number of claimReward calls which reach the round limit before all rewards are claimed
+    uint256 public limitedClaims;
+    uint256 public rewardPerClaim;
+    uint256 public claimCount;
+
+    event claimedReward(address indexed delegator, uint256 amount, bool allClaimed);
+
+    constructor(uint256 _limitedClaims, uint256 _rewardPerClaim) {
+        limitedClaims = _limitedClaims;
+        rewardPerClaim = _rewardPerClaim;
+    }
+
+    function delegateCoin(address) external payable {
+    }
+
+    function undelegateCoin(address, uint256) external {
+    }
+
+    function transferCoin(address, address, uint256) external {
+    }
+
+    function claimReward(address[] calldata) external returns (uint256, bool) {
+        claimCount += 1;
+        bool allClaimed = claimCount > limitedClaims;
+        (bool success, ) = msg.sender.call{value: rewardPerClaim}("");
+        require(success, "reward transfer failed");
+        emit claimedReward(msg.sender, rewardPerClaim, allClaimed);
+        return (rewardPerClaim, allClaimed);
+    }
+
+    receive() external payable {
+    }
+}
@@ -54,3 +54,53 @@ def turn_round(miners: list = None, tx_fee=100, round_count=1, trigger=None, bef
         chain.sleep(1)
 
     return tx
+
+
+def trial_undelegate(keys: list, amounts: dict, amount, pledge_limit):
+    """
+    Replays how Earn undelegates the amount from validators
+    keys are the validators in ascending order of delegate amounts as kept by the contract
+    Returns the amount which can not be undelegated and the amount undelegated from each validator
+    """
+    keys = list(keys)
+    amounts = dict(amounts)
+    deduction = {}
+    # a single validator covering the amount is preferred, looking from the top down to the amount
+    for key in reversed(keys):
+        if amounts[key] < amount:
+            break
+        if amounts[key] == amount or amounts[key] >= amount + pledge_limit:
+            deduction[key] = amount
+            return 0, deduction
+    key = keys[-1]
+    reached_end = False
+    while key is not None and amount > 0:
+        index = keys.index(key)
+        prev_key = keys[index - 1] if index > 0 else None
+        validator_amount = amounts[key]
+        undelegate_amount = 0
+        if validator_amount == 0:
+            pass
+        elif amount == validator_amount or validator_amount >= amount + pledge_limit:
+            undelegate_amount = amount
+        elif amount < validator_amount:
+            if amount - pledge_limit > pledge_limit:
+                undelegate_amount = amount - pledge_limit
+        elif amount >= validator_amount + pledge_limit:
+            undelegate_amount = validator_amount
+        elif validator_amount - pledge_limit > pledge_limit:
+            undelegate_amount = validator_amount - pledge_limit
+        if undelegate_amount > 0:
+            amount -= undelegate_amount
+            deduction[key] = deduction.get(key, 0) + undelegate_amount
+            amounts[key] -= undelegate_amount
+            # the key moves towards the head as in the contract
+            keys.pop(index)
+            while index > 0 and amounts[keys[index - 1]] > amounts[key]:
+                index -= 1
+            keys.insert(index, key)
+        key = prev_key
+        if key is None and not reached_end:
+            key = keys[-1]
+            reached_end = True
+    return amount, deduction
@@ -1,12 +1,13 @@
 import time
-from brownie import accounts, Wei, TestEarnProxy, UpgradeEarn, Contract, EarnProxy, WithdrawReentry
+from brownie import accounts, chain, Wei, TestEarnProxy, UpgradeEarn, Contract, EarnProxy, WithdrawReentry, EarnLens, \
+    EarnMock, EarnV1Mock, RoundLimitPledgeAgent
 from brownie.test import given, strategy
 from hypothesis import settings
 from .common import get_exchangerate, get_current_round
 import brownie
 import pytest
 from web3 import Web3
-from .common import register_candidate, turn_round
+from .common import register_candidate, turn_round, trial_undelegate
 from .utils import get_tracker, expect_event, expect_query, encode_args_with_signature, expect_event_not_emitted, \
     transaction_raw_data
 from decimal import Decimal, getcontext
@@ -44,7 +45,6 @@ def set_agent_pledge_contract_address(candidate_hub, earn, pledge_agent, validat
                             {'from': accounts[0]})
     earn.updateOperator(accounts[0].address, {'from': accounts[0]})
     earn.setAfterTurnRoundClaimReward(True, {'from': accounts[0]})
-    earn.setUnDelegateValidatorState(True, {'from': accounts[0]})
     earn.setDayInterval(INIT_DAY_INTERVAL, {'from': accounts[0]})
 
 
@@ -121,6 +121,36 @@ def test_mint_validator_reject_delegate(earn, candidate_hub):
         earn.mint(operators[1], {'value': MIN_DELEGATE_VALUE, 'from': accounts[0]})
 
 
+def test_flush_skips_validator_refused_in_round(earn, candidate_hub):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:5]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE})
+    earn.mint(operators[1], {'value': MIN_DELEGATE_VALUE})
+    turn_round(trigger=True)
+    earn.updateMintBufferEnabled(True)
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE})
+    earn.mint(operators[1], {'value': MIN_DELEGATE_VALUE})
+    candidate_hub.refuseDelegate({'from': operators[0]})
+    with brownie.reverts("Can not delegate to validator"):
+        earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE})
+    tx = earn.flushPendingDelegations()
+    assert len(tx.events['Delegate']) == 1
+    expect_event(tx, "Delegate", {
+        "validator": operators[1],
+        "amount": MIN_DELEGATE_VALUE
+    })
+    assert earn.getValidatorDelegate(operators[0]) == MIN_DELEGATE_VALUE
+    assert earn.balance() == MIN_DELEGATE_VALUE
+    turn_round(trigger=True)
+    assert earn.getValidatorDelegateMapLength() == 1
+    assert earn.getValidatorDelegate(operators[0]) == 0
+    assert earn.getValidatorDelegate(operators[1]) == MIN_DELEGATE_VALUE * 4
+
+
 def test_mint_invalid_validator(earn):
     operators = []
     consensuses = []
@@ -132,6 +162,141 @@ def test_mint_invalid_validator(earn):
         earn.mint('0x0000000000000000000000000000000000000000', {'value': ONE_ETHER * 30, 'from': accounts[0]})
 
 
+def test_mint_to_least_delegated_validator(earn, candidate_hub):
+    operators = []
+    consensuses = []
+    for operator in accounts[2:5]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    error_msg = encode_args_with_signature("EarnEmptyValidator()", [])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.mintToLeastDelegated({'value': MIN_DELEGATE_VALUE})
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE * 3})
+    earn.mint(operators[1], {'value': MIN_DELEGATE_VALUE})
+    earn.mint(operators[2], {'value': MIN_DELEGATE_VALUE * 5 // 2})
+    turn_round(trigger=True)
+    tx = earn.mintToLeastDelegated({'value': MIN_DELEGATE_VALUE, 'from': accounts[1]})
+    expect_event(tx, "Delegate", {
+        "validator": operators[1],
+        "amount": MIN_DELEGATE_VALUE
+    })
+    expect_event(tx, "Mint", {
+        "account": accounts[1],
+        "core": MIN_DELEGATE_VALUE
+    })
+    earn.mintToLeastDelegated({'value': MIN_DELEGATE_VALUE * 2, 'from': accounts[1]})
+    assert earn.getValidatorDelegate(operators[1]) == MIN_DELEGATE_VALUE * 4
+    tx = earn.mintToLeastDelegated({'value': MIN_DELEGATE_VALUE, 'from': accounts[1]})
+    expect_event(tx, "Delegate", {
+        "validator": operators[2]
+    })
+    # new elected validators passed to afterTurnRound are the least delegated
+    new_operator = accounts[5]
+    register_candidate(operator=new_operator)
+    candidate_hub.turnRound()
+    earn.afterTurnRound([new_operator, operators[0]])
+    tx = earn.mintToLeastDelegated({'value': MIN_DELEGATE_VALUE, 'from': accounts[1]})
+    expect_event(tx, "Delegate", {
+        "validator": new_operator,
+        "amount": MIN_DELEGATE_VALUE
+    })
+    tx = earn.mintToLeastDelegated({'value': MIN_DELEGATE_VALUE, 'from': accounts[1]})
+    expect_event(tx, "Delegate", {
+        "validator": new_operator,
+        "amount": MIN_DELEGATE_VALUE
+    })
+
+
+def test_mint_to_least_delegated_skips_refused_and_counts_pending(earn, candidate_hub):
+    operators = []
+    consensuses = []
+    for operator in accounts[2:5]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE * 3})
+    earn.mint(operators[1], {'value': MIN_DELEGATE_VALUE})
+    earn.mint(operators[2], {'value': MIN_DELEGATE_VALUE * 2})
+    turn_round(trigger=True)
+    candidate_hub.refuseDelegate({'from': operators[1]})
+    tx = earn.mintToLeastDelegated({'value': MIN_DELEGATE_VALUE})
+    expect_event(tx, "Delegate", {
+        "validator": operators[2],
+        "amount": MIN_DELEGATE_VALUE
+    })
+    earn.updateMintBufferEnabled(True)
+    earn.mint(operators[2], {'value': MIN_DELEGATE_VALUE * 2})
+    for _ in range(2):
+        tx = earn.mintToLeastDelegated({'value': MIN_DELEGATE_VALUE})
+        assert 'Delegate' not in tx.events
+    assert earn.getPendingDelegation(operators[0]) == MIN_DELEGATE_VALUE * 2
+    assert earn.getPendingDelegation(operators[1]) == 0
+    assert earn.getPendingDelegation(operators[2]) == MIN_DELEGATE_VALUE * 2
+
+
+def test_mint_with_delegate_hint(earn):
+    operators = []
+    consensuses = []
+    for operator in accounts[2:5]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE * 3})
+    earn.mint(operators[1], {'value': MIN_DELEGATE_VALUE})
+    earn.mint(operators[2], {'value': MIN_DELEGATE_VALUE * 5 // 2})
+    hint = earn.getDelegateHint(operators[1], MIN_DELEGATE_VALUE * 3)
+    assert hint == operators[0]
+    tx = earn.mintWithHint(operators[1], hint, {'value': MIN_DELEGATE_VALUE * 3})
+    expect_event(tx, "Delegate", {
+        "validator": operators[1],
+        "amount": MIN_DELEGATE_VALUE * 3
+    })
+    assert earn.getValidatorDelegate(operators[1]) == MIN_DELEGATE_VALUE * 4
+    turn_round(trigger=True)
+    tx = earn.mintToLeastDelegated({'value': MIN_DELEGATE_VALUE})
+    expect_event(tx, "Delegate", {
+        "validator": operators[2]
+    })
+    # a wrong hint falls back to walking the list
+    earn.mintWithHint(operators[0], operators[2], {'value': MIN_DELEGATE_VALUE * 2})
+    tx = earn.mintToLeastDelegated({'value': MIN_DELEGATE_VALUE})
+    expect_event(tx, "Delegate", {
+        "validator": operators[2]
+    })
+
+
+def test_mint_batch_to_many_recipients(earn, stcore):
+    operators = []
+    consensuses = []
+    for operator in accounts[2:4]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    recipients = [accounts[4], accounts[5], accounts[6]]
+    amounts = [MIN_DELEGATE_VALUE, MIN_DELEGATE_VALUE * 2, MIN_DELEGATE_VALUE * 3]
+    error_msg = encode_args_with_signature("EarnMintBatchEmpty()", [])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.mintBatch(operators[0], [], [], {'value': 0})
+    error_msg = encode_args_with_signature("EarnMintBatchLengthMismatch(uint256,uint256)", [3, 2])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.mintBatch(operators[0], recipients, amounts[:2], {'value': MIN_DELEGATE_VALUE * 3})
+    error_msg = encode_args_with_signature("EarnMintBatchValueMismatch(uint256,uint256)",
+                                           [MIN_DELEGATE_VALUE * 5, MIN_DELEGATE_VALUE * 6])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.mintBatch(operators[0], recipients, amounts, {'value': MIN_DELEGATE_VALUE * 5})
+    tx = earn.mintBatch(operators[0], recipients, amounts, {'value': MIN_DELEGATE_VALUE * 6})
+    assert len(tx.events['Delegate']) == 1
+    expect_event(tx, "Delegate", {
+        "validator": operators[0],
+        "amount": MIN_DELEGATE_VALUE * 6
+    })
+    assert len(tx.events['Mint']) == 3
+    for recipient, amount in zip(recipients, amounts):
+        assert stcore.balanceOf(recipient) == amount
+    assert earn.getValidatorDelegate(operators[0]) == MIN_DELEGATE_VALUE * 6
+
+
 def test_delegate_staking_core_exchange_rate(earn, stcore):
     operators = []
     consensuses = []
@@ -383,6 +548,46 @@ def test_trigger_claim_reward_failed_delegate(earn):
     assert get_exchangerate() == (delegate_amount * 2 + total_reward * 3) * RATE_MULTIPLE // (delegate_amount * 2)
 
 
+def test_trigger_claim_reward_in_single_call(earn):
+    operators = []
+    consensuses = []
+    for operator in accounts[2:5]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    for operator in operators:
+        earn.mint(operator, {'value': MIN_DELEGATE_VALUE})
+    turn_round(trigger=True)
+    tx = turn_round(consensuses, round_count=1, trigger=True)
+    assert len(tx.events['claimedReward']) == 1
+    assert earn.balance() == 0
+    assert tx.events['Delegate']['amount'] == tx.events['claimedReward']['amount']
+
+
+def test_trigger_claim_reward_until_round_limit_not_reached(earn, candidate_hub):
+    operators = []
+    for operator in accounts[2:5]:
+        operators.append(operator)
+        register_candidate(operator=operator)
+    turn_round()
+    for operator in operators:
+        earn.mint(operator, {'value': MIN_DELEGATE_VALUE})
+    reward = MIN_DELEGATE_VALUE
+    round_limit_agent = RoundLimitPledgeAgent.deploy(2, reward, {'from': accounts[0]})
+    accounts[0].transfer(round_limit_agent.address, reward * 3)
+    earn.setContractAddress(candidate_hub.address, round_limit_agent.address, candidate_hub.getRoundTag())
+    turn_round()
+    tx = earn.afterTurnRound([])
+    assert round_limit_agent.claimCount() == 3
+    assert [event['allClaimed'] for event in tx.events['claimedReward']] == [False, False, True]
+    assert earn.balance() == 0
+    assert tx.events['Delegate']['amount'] == reward * 3
+    expect_event(tx, "CalculateExchangeRate", {
+        "round": candidate_hub.getRoundTag(),
+        "exchangeRate": (MIN_DELEGATE_VALUE * 3 + reward * 3) * RATE_MULTIPLE // (MIN_DELEGATE_VALUE * 3),
+    })
+
+
 def test_trigger_claim_reward_failed_redeem(earn):
     operators = []
     consensuses = []
@@ -738,12 +943,93 @@ def test_withdraw_and_undelegate(earn, pledge_agent, update_lock_time):
     tracker0 = get_tracker(accounts[0])
     exchange_amount = token_value * get_exchangerate() / RATE_MULTIPLE
     earn.redeem(token_value)
-    earn.setUnDelegateValidatorState(False)
     earn.withdraw()
     assert tracker0.delta() == exchange_amount
     assert earn.getValidatorDelegate(operators[0]) == MIN_DELEGATE_VALUE + total_reward - exchange_amount
 
 
+def test_mint_buffer_delegates_in_after_turn_round(earn, stcore):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:5]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.updateMintBufferEnabled(True)
+    tx = earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE})
+    assert 'Delegate' not in tx.events
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE, 'from': accounts[1]})
+    earn.mint(operators[1], {'value': PLEDGE_LIMIT})
+    assert stcore.balanceOf(accounts[0]) == MIN_DELEGATE_VALUE + PLEDGE_LIMIT
+    assert earn.pendingDelegateAmount() == MIN_DELEGATE_VALUE * 2 + PLEDGE_LIMIT
+    assert earn.getPendingDelegation(operators[0]) == MIN_DELEGATE_VALUE * 2
+    assert earn.getTotalDelegateAmount() == 0
+    tx = turn_round(trigger=True)
+    assert len(tx.events['Delegate']) == 2
+    assert earn.pendingDelegateAmount() == 0
+    assert earn.getPendingDelegation(operators[0]) == 0
+    assert earn.getValidatorDelegate(operators[0]) == MIN_DELEGATE_VALUE * 2
+    assert earn.getValidatorDelegate(operators[1]) == PLEDGE_LIMIT
+    assert earn.getCurrentExchangeRate() == RATE_MULTIPLE
+    earn.mint(operators[1], {'value': PLEDGE_LIMIT})
+    tx = earn.flushPendingDelegations()
+    expect_event(tx, "Delegate", {
+        "validator": operators[1],
+        "amount": PLEDGE_LIMIT
+    })
+    assert earn.getValidatorDelegate(operators[1]) == PLEDGE_LIMIT * 2
+
+
+def test_withdraw_netted_against_buffered_mint(earn, update_lock_time):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:5]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE * 2, 'from': accounts[1]})
+    turn_round(trigger=True)
+    earn.redeem(MIN_DELEGATE_VALUE, {'from': accounts[1]})
+    earn.updateMintBufferEnabled(True)
+    earn.mint(operators[1], {'value': MIN_DELEGATE_VALUE + PLEDGE_LIMIT})
+    tracker1 = get_tracker(accounts[1])
+    tx = earn.withdraw({'from': accounts[1]})
+    expect_event_not_emitted(tx, 'UnDelegate')
+    assert tracker1.delta() == MIN_DELEGATE_VALUE
+    assert earn.pendingDelegateAmount() == PLEDGE_LIMIT
+    assert earn.getPendingDelegation(operators[1]) == PLEDGE_LIMIT
+    assert earn.getValidatorDelegate(operators[0]) == MIN_DELEGATE_VALUE * 2
+    assert earn.toWithdrawAmount() == 0
+
+
+def test_rewards_reinvested_while_redemptions_locked(earn):
+    operators = []
+    consensuses = []
+    total_reward = BLOCK_REWARD // 2
+    for operator in accounts[3:4]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE * 2})
+    turn_round(trigger=True)
+    earn.updateMintBufferEnabled(True)
+    earn.redeem(MIN_DELEGATE_VALUE)
+    tx = turn_round(consensuses, trigger=True)
+    expect_event(tx, "Delegate", {
+        "validator": operators[0],
+        "amount": total_reward
+    })
+    assert earn.withdrawReserve() == 0
+    tx = earn.updateWithdrawReserveLimit(PLEDGE_LIMIT)
+    expect_event(tx, "UpdateWithdrawReserveLimit", {
+        "caller": accounts[0],
+        "withdrawReserveLimit": PLEDGE_LIMIT
+    })
+    turn_round(consensuses, trigger=True)
+    assert earn.withdrawReserve() == PLEDGE_LIMIT
+    assert earn.toWithdrawAmount() == MIN_DELEGATE_VALUE
+
+
 def test_redeem_below_min_limit(earn):
     operators = []
     consensuses = []
@@ -1080,6 +1366,7 @@ def test_partial_withdraw_success(earn, update_lock_time):
     earn.redeem(token_value + 1)
     earn.setDayInterval(2)
     earn.redeem(token_value + 2)
+    chain.sleep(2)
     earn.redeem(token_value + 3)
     redeem_record = earn.getRedeemRecords(accounts[0])
     for index, record in enumerate(redeem_record):
@@ -1090,6 +1377,58 @@ def test_partial_withdraw_success(earn, update_lock_time):
     assert tracker0.delta() == token_value * 2 + 1
 
 
+def test_withdraw_stops_at_first_locked_record(earn, update_lock_time):
+    operators = []
+    consensuses = []
+    for operator in accounts[2:3]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE * 3})
+    token_value = MIN_DELEGATE_VALUE * 3 // 5
+    earn.redeem(token_value)
+    earn.setDayInterval(INIT_DAY_INTERVAL)
+    earn.redeem(token_value + 1)
+    tracker0 = get_tracker(accounts[0])
+    earn.withdraw()
+    assert tracker0.delta() == token_value
+    redeem_record = earn.getRedeemRecords(accounts[0])
+    assert len(redeem_record) == 1
+    assert redeem_record[0][3] == token_value + 1
+
+
+def test_redeem_unlocking_earlier_queued_before_locked_records(earn, update_lock_time):
+    operators = []
+    consensuses = []
+    for operator in accounts[2:3]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE * 3})
+    token_value = MIN_DELEGATE_VALUE * 3 // 5
+    earn.redeem(token_value)
+    earn.setDayInterval(INIT_DAY_INTERVAL)
+    earn.redeem(token_value + 1)
+    earn.setDayInterval(0)
+    tx = earn.redeem(token_value + 2)
+    redeem_record = earn.getRedeemRecords(accounts[0])
+    assert [record[3] for record in redeem_record] == [token_value, token_value + 2, token_value + 1]
+    assert redeem_record[1][1] == tx.timestamp - 10
+    assert earn.redeemRecords(accounts[0], 1) == redeem_record[1]
+    tracker0 = get_tracker(accounts[0])
+    earn.withdraw()
+    assert tracker0.delta() == token_value * 2 + 2
+    redeem_record = earn.getRedeemRecords(accounts[0])
+    assert len(redeem_record) == 1
+    assert redeem_record[0][3] == token_value + 1
+    redeem_amount = earn.getRedeemAmount(accounts[0])
+    assert redeem_amount['unlockedAmount'] == 0
+    assert redeem_amount['lockedAmount'] == token_value + 1
+    error_msg = encode_args_with_signature("EarnRedeemRecordNotFound(address)", [accounts[0].address])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.redeemRecords(accounts[0], 1)
+
+
 def test_withdraw_before_unlock_time(earn):
     operators = []
     consensuses = []
@@ -1171,6 +1510,78 @@ def test_generate_exchange_rates_and_store(earn):
             continue
         rate += total_reward * 100
         assert rate == exchange_rate
+    exchange_rates = earn.getExchangeRates(6)
+    for index in range(len(exchange_rates)):
+        assert earn.exchangeRates(index) == exchange_rates[index]
+    error_msg = encode_args_with_signature("EarnExchangeRateIndexNotFound(uint256)", [len(exchange_rates)])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.exchangeRates(len(exchange_rates))
+
+
+def test_exchange_rate_of_dust_supply(earn, stcore):
+    operators = []
+    consensuses = []
+    for operator in accounts[2:3]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE})
+    turn_round()
+    earn.redeem(MIN_DELEGATE_VALUE - 1)
+    assert stcore.totalSupply() == 1
+    reward = ONE_ETHER // 10
+    tx = turn_round(consensuses, tx_fee=reward, trigger=True)
+    rate = earn.getCurrentExchangeRate()
+    assert rate > 2 ** 72
+    assert tx.events['CalculateExchangeRate']['exchangeRate'] == rate
+    assert earn.getExchangeRates(1)[0] == rate
+    turn_round(consensuses, tx_fee=reward, trigger=True)
+    assert earn.getCurrentExchangeRate() > rate
+
+
+def test_query_exchange_rates_by_round(earn):
+    operators = []
+    consensuses = []
+    for operator in accounts[2:4]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE})
+    turn_round(consensuses, round_count=5, trigger=True)
+    current_round = get_current_round()
+    rounds, rates = earn.getExchangeRatesByRound(1, current_round)
+    assert len(rounds) == 5
+    assert rounds[-1] == current_round
+    assert list(rates) == list(earn.getExchangeRates(5))
+    for round_tag, rate in zip(rounds, rates):
+        assert earn.getExchangeRateAt(round_tag) == rate
+    assert earn.getExchangeRateAt(current_round + 10) == earn.getCurrentExchangeRate()
+    earn.updateExchangeRateQueryLimit(2)
+    rounds, rates = earn.getExchangeRatesByRound(1, current_round)
+    assert len(rounds) == len(rates) == 2
+    error_msg = encode_args_with_signature("EarnExchangeRateNotFound(uint256)", [0])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.getExchangeRateAt(0)
+
+
+def test_exchange_rate_growth_between_rounds(earn):
+    operators = []
+    consensuses = []
+    for operator in accounts[2:4]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE})
+    turn_round(consensuses, round_count=5, trigger=True)
+    current_round = get_current_round()
+    rounds, rates = earn.getExchangeRatesByRound(1, current_round)
+    growth, round_count = earn.getExchangeRateGrowth(rounds[0], current_round + 3)
+    assert growth == rates[-1] * RATE_MULTIPLE // rates[0]
+    assert round_count == current_round + 3 - rounds[0]
+    assert earn.getExchangeRateGrowth(rounds[1], rounds[1]) == (RATE_MULTIPLE, 0)
+    error_msg = encode_args_with_signature("EarnInvalidRoundRange(uint256,uint256)", [current_round, rounds[0]])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.getExchangeRateGrowth(current_round, rounds[0])
 
 
 def test_redemption_no_stake_skip(earn, validator_set, update_lock_time):
@@ -1186,16 +1597,100 @@ def test_redemption_no_stake_skip(earn, validator_set, update_lock_time):
     turn_round(trigger=True)
     earn.setAfterTurnRoundClaimReward(False)
     turn_round(consensuses, trigger=True)
-    earn.setUnDelegateValidatorState(False)
-    earn.redeem(MIN_DELEGATE_VALUE)
-    earn.withdraw()
-    earn.setUnDelegateValidatorIndex(1)
+    earn.redeem(MIN_DELEGATE_VALUE + 2, {'from': accounts[1]})
+    earn.withdraw({'from': accounts[1]})
     earn.redeem(MIN_DELEGATE_VALUE + 1, {'from': accounts[1]})
     earn.withdraw({'from': accounts[1]})
     assert earn.getValidatorDelegate(operators[1]) == 0
+    assert earn.getValidatorDelegate(operators[2]) == 0
+    earn.redeem(MIN_DELEGATE_VALUE)
+    earn.withdraw()
+    assert earn.getValidatorDelegate(operators[0]) == 0
     assert earn.getValidatorDelegateMapLength() == 3
 
 
+def test_withdraw_for_multiple_accounts(earn, update_lock_time):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:5]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE * 4})
+    turn_round(trigger=True)
+    trackers = []
+    for i in range(3):
+        earn.mint(operators[1], {'value': MIN_DELEGATE_VALUE, 'from': accounts[i + 1]})
+        earn.redeem(MIN_DELEGATE_VALUE, {'from': accounts[i + 1]})
+        trackers.append(get_tracker(accounts[i + 1]))
+    tx = earn.withdrawFor([accounts[1], accounts[2], accounts[3], accounts[5]], {'from': accounts[6]})
+    assert len(tx.events['Withdraw']) == 3
+    expect_event(tx, "UnDelegate", {
+        "validator": operators[0],
+        "amount": MIN_DELEGATE_VALUE * 3
+    })
+    for tracker in trackers:
+        assert tracker.delta() == MIN_DELEGATE_VALUE
+    assert earn.toWithdrawAmount() == 0
+    assert len(earn.getRedeemRecords(accounts[1])) == 0
+    error_msg = encode_args_with_signature("EarnWithdrawForNoUnlockedRecord()", [])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.withdrawFor([accounts[1]])
+
+
+def test_withdrawal_queue_finalize_and_claim(earn, update_lock_time):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:5]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE * 4})
+    turn_round(trigger=True)
+    earn.mint(operators[1], {'value': MIN_DELEGATE_VALUE * 2, 'from': accounts[1]})
+    earn.mint(operators[1], {'value': MIN_DELEGATE_VALUE, 'from': accounts[2]})
+    earn.requestWithdrawal(MIN_DELEGATE_VALUE, {'from': accounts[1]})
+    earn.requestWithdrawal(MIN_DELEGATE_VALUE, {'from': accounts[2]})
+    earn.setDayInterval(INIT_DAY_INTERVAL)
+    tx = earn.requestWithdrawal(MIN_DELEGATE_VALUE, {'from': accounts[1]})
+    expect_event(tx, "RequestWithdrawal", {
+        "account": accounts[1],
+        "requestId": 3,
+        "core": MIN_DELEGATE_VALUE
+    })
+    error_msg = encode_args_with_signature("EarnWithdrawalRequestNotFinalized(uint256)", [1])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.claimWithdrawal(1, {'from': accounts[1]})
+    tx = earn.finalizeWithdrawals(10, {'from': accounts[6]})
+    expect_event(tx, "FinalizeWithdrawals", {
+        "fromRequestId": 1,
+        "toRequestId": 2,
+        "amount": MIN_DELEGATE_VALUE * 2
+    })
+    expect_event(tx, "UnDelegate", {
+        "validator": operators[0],
+        "amount": MIN_DELEGATE_VALUE * 2
+    })
+    assert earn.getWithdrawalRequestIds() == (3, 2)
+    assert earn.claimableAmount() == MIN_DELEGATE_VALUE * 2
+    assert earn.toWithdrawAmount() == MIN_DELEGATE_VALUE
+    error_msg = encode_args_with_signature("EarnWithdrawalRequestNotOwned(address,uint256)", [accounts[2].address, 1])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.claimWithdrawal(1, {'from': accounts[2]})
+    tracker = get_tracker(accounts[1])
+    earn.claimWithdrawal(1, {'from': accounts[1]})
+    assert tracker.delta() == MIN_DELEGATE_VALUE
+    assert earn.getWithdrawalRequest(1) == ('0x0000000000000000000000000000000000000000', earn.getWithdrawalRequest(2)[1], MIN_DELEGATE_VALUE, True)
+    error_msg = encode_args_with_signature("EarnWithdrawalRequestNotOwned(address,uint256)", [accounts[1].address, 1])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.claimWithdrawal(1, {'from': accounts[1]})
+    earn.claimWithdrawal(2, {'from': accounts[2]})
+    assert earn.claimableAmount() == 0
+    error_msg = encode_args_with_signature("EarnNoWithdrawalRequestToFinalize()", [])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.finalizeWithdrawals(10)
+
+
 def test_withdraw_undelegate_scenario1(earn, update_lock_time):
     operators = []
     consensuses = []
@@ -1205,13 +1700,70 @@ def test_withdraw_undelegate_scenario1(earn, update_lock_time):
     turn_round()
     mint_amount = MIN_DELEGATE_VALUE + PLEDGE_LIMIT - 1
     earn.mint(operators[0], {'value': mint_amount})
-    earn.mint(operators[1], {'value': MIN_DELEGATE_VALUE})
+    earn.mint(operators[1], {'value': MIN_DELEGATE_VALUE // 2})
     turn_round(trigger=True)
-    earn.setUnDelegateValidatorState(False)
     earn.redeem(MIN_DELEGATE_VALUE)
     earn.withdraw()
     assert earn.getValidatorDelegate(operators[0]) == PLEDGE_LIMIT + PLEDGE_LIMIT - 1
-    assert earn.getValidatorDelegate(operators[1]) == MIN_DELEGATE_VALUE - PLEDGE_LIMIT
+    assert earn.getValidatorDelegate(operators[1]) == MIN_DELEGATE_VALUE // 2 - PLEDGE_LIMIT
+
+
+def test_withdraw_undelegate_from_single_covering_validator(earn, update_lock_time):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:7]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': PLEDGE_LIMIT * 2})
+    earn.mint(operators[1], {'value': PLEDGE_LIMIT * 2})
+    earn.mint(operators[2], {'value': PLEDGE_LIMIT * 2})
+    earn.mint(operators[3], {'value': PLEDGE_LIMIT * 7})
+    turn_round(trigger=True)
+    tracker0 = get_tracker(accounts[0])
+    earn.redeem(PLEDGE_LIMIT * 6)
+    tx = earn.withdraw()
+    assert len(tx.events['UnDelegate']) == 1
+    expect_event(tx, "UnDelegate", {
+        "validator": operators[3],
+        "amount": PLEDGE_LIMIT * 6
+    })
+    for i in range(3):
+        assert earn.getValidatorDelegate(operators[i]) == PLEDGE_LIMIT * 2
+    assert earn.getValidatorDelegate(operators[3]) == PLEDGE_LIMIT
+    assert tracker0.delta() == PLEDGE_LIMIT * 6
+    earn.redeem(PLEDGE_LIMIT * 2)
+    tx = earn.withdraw()
+    assert len(tx.events['UnDelegate']) == 1
+    expect_event(tx, "UnDelegate", {
+        "validator": operators[0],
+        "amount": PLEDGE_LIMIT * 2
+    })
+
+
+def test_withdraw_undelegate_from_exact_cover_validator_below_max(earn, update_lock_time):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:6]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': PLEDGE_LIMIT * 2})
+    earn.mint(operators[1], {'value': PLEDGE_LIMIT * 5})
+    earn.mint(operators[2], {'value': PLEDGE_LIMIT * 5 + PLEDGE_LIMIT // 2})
+    turn_round(trigger=True)
+    tracker0 = get_tracker(accounts[0])
+    earn.redeem(PLEDGE_LIMIT * 5)
+    tx = earn.withdraw()
+    assert len(tx.events['UnDelegate']) == 1
+    expect_event(tx, "UnDelegate", {
+        "validator": operators[1],
+        "amount": PLEDGE_LIMIT * 5
+    })
+    assert earn.getValidatorDelegate(operators[0]) == PLEDGE_LIMIT * 2
+    assert earn.getValidatorDelegate(operators[1]) == 0
+    assert earn.getValidatorDelegate(operators[2]) == PLEDGE_LIMIT * 5 + PLEDGE_LIMIT // 2
+    assert tracker0.delta() == PLEDGE_LIMIT * 5
 
 
 def test_withdraw_undelegate_scenario2(earn, update_lock_time):
@@ -1228,7 +1780,6 @@ def test_withdraw_undelegate_scenario2(earn, update_lock_time):
     earn.mint(operators[1], {'value': PLEDGE_LIMIT * 2 - 1})
     earn.mint(operators[2], {'value': PLEDGE_LIMIT})
     turn_round(trigger=True)
-    earn.setUnDelegateValidatorState(False)
     tracker0 = get_tracker(accounts[0])
     earn.redeem(MIN_DELEGATE_VALUE)
     earn.withdraw()
@@ -1250,7 +1801,6 @@ def test_withdraw_undelegate_scenario3(earn, update_lock_time):
     earn.mint(operators[1], {'value': PLEDGE_LIMIT * 2 - 1})
     earn.mint(operators[2], {'value': PLEDGE_LIMIT * 2 - 1})
     turn_round(trigger=True)
-    earn.setUnDelegateValidatorState(False)
     earn.redeem(MIN_DELEGATE_VALUE)
     error_msg = encode_args_with_signature("EarnUnDelegateFailedFinally(address,uint256)",
                                            [str(accounts[0].address), PLEDGE_LIMIT])
@@ -1270,8 +1820,6 @@ def test_withdraw_undelegate_scenario4(earn, update_lock_time):
     earn.mint(operators[2], {'value': PLEDGE_LIMIT * 2 - 1})
     earn.mint(operators[3], {'value': PLEDGE_LIMIT * 2 - 1})
     turn_round(trigger=True)
-    earn.setUnDelegateValidatorState(False)
-    earn.setUnDelegateValidatorIndex(1)
     earn.redeem(PLEDGE_LIMIT)
     error_msg = encode_args_with_signature("EarnUnDelegateFailedFinally(address,uint256)",
                                            [str(accounts[0].address), PLEDGE_LIMIT])
@@ -1294,7 +1842,6 @@ def test_withdraw_undelegate_scenario5(earn, update_lock_time):
     earn.mint(operators[1], {'value': PLEDGE_LIMIT * 2 - 1})
     earn.mint(operators[2], {'value': PLEDGE_LIMIT * 2})
     turn_round(trigger=True)
-    earn.setUnDelegateValidatorState(False)
     tracker0 = get_tracker(accounts[0])
     earn.redeem(redeem_amount)
     earn.withdraw()
@@ -1316,12 +1863,11 @@ def test_withdraw_undelegate_scenario6(earn, update_lock_time):
     earn.mint(operators[1], {'value': PLEDGE_LIMIT * 3 - 1})
     earn.mint(operators[2], {'value': PLEDGE_LIMIT + 1})
     turn_round(trigger=True)
-    earn.setUnDelegateValidatorState(False)
     tracker0 = get_tracker(accounts[0])
     earn.redeem(redeem_amount)
     earn.withdraw()
-    assert earn.getValidatorDelegate(operators[0]) == 0
-    assert earn.getValidatorDelegate(operators[1]) == PLEDGE_LIMIT
+    assert earn.getValidatorDelegate(operators[0]) == PLEDGE_LIMIT
+    assert earn.getValidatorDelegate(operators[1]) == 0
     assert earn.getValidatorDelegate(operators[2]) == 0
     assert tracker0.delta() == redeem_amount
 
@@ -1338,7 +1884,6 @@ def test_withdraw_undelegate_scenario7(earn, update_lock_time):
     earn.mint(operators[1], {'value': PLEDGE_LIMIT * 3 - 1})
     earn.mint(operators[2], {'value': PLEDGE_LIMIT})
     turn_round(trigger=True)
-    earn.setUnDelegateValidatorState(False)
     tracker0 = get_tracker(accounts[0])
     earn.redeem(redeem_amount)
     earn.withdraw()
@@ -1360,7 +1905,6 @@ def test_withdraw_undelegate_scenario8(earn, update_lock_time):
     earn.mint(operators[1], {'value': PLEDGE_LIMIT + 1})
     earn.mint(operators[2], {'value': PLEDGE_LIMIT * 2})
     turn_round(trigger=True)
-    earn.setUnDelegateValidatorState(False)
     earn.redeem(redeem_amount)
     error_msg = encode_args_with_signature("EarnUnDelegateFailedFinally(address,uint256)",
                                            [str(accounts[0].address), redeem_amount - (PLEDGE_LIMIT * 4 - 1)])
@@ -1379,7 +1923,6 @@ def test_withdraw_undelegate_scenario9(earn, update_lock_time):
     earn.mint(operators[0], {'value': PLEDGE_LIMIT * 7})
     earn.mint(operators[1], {'value': PLEDGE_LIMIT * 3 - 1})
     turn_round(trigger=True)
-    earn.setUnDelegateValidatorState(False)
     earn.redeem(redeem_amount)
     earn.withdraw()
     assert earn.getValidatorDelegate(operators[0]) == PLEDGE_LIMIT
@@ -1398,7 +1941,6 @@ def test_withdraw_undelegate_scenario10(earn, update_lock_time):
     earn.mint(operators[1], {'value': PLEDGE_LIMIT})
     earn.mint(operators[2], {'value': PLEDGE_LIMIT})
     turn_round(trigger=True)
-    earn.setUnDelegateValidatorState(False)
     earn.redeem(redeem_amount)
     earn.withdraw()
     assert earn.getValidatorDelegate(operators[0]) == earn.getValidatorDelegate(operators[1]) == \
@@ -1412,8 +1954,6 @@ def test_cancel_delegation_after_multiple_redeems(earn, update_lock_time):
         operators.append(operator)
         consensuses.append(register_candidate(operator=operator))
     turn_round()
-    earn.setUnDelegateValidatorState(False)
-    earn.setUnDelegateValidatorIndex(0)
     earn.mint(operators[0], {'value': PLEDGE_LIMIT * 5})
     turn_round(trigger=True)
     earn.redeem(PLEDGE_LIMIT)
@@ -1441,8 +1981,6 @@ def test_withdraw_no_sufficient_balance_in_validators(earn, update_lock_time):
     earn.mint(operators[2], {'value': PLEDGE_LIMIT * 2 - 1})
     earn.mint(operators[3], {'value': PLEDGE_LIMIT * 2 - 1})
     turn_round(trigger=True)
-    earn.setUnDelegateValidatorState(False)
-    earn.setUnDelegateValidatorIndex(1)
     earn.redeem(PLEDGE_LIMIT)
     error_msg = encode_args_with_signature("EarnUnDelegateFailedFinally(address,uint256)",
                                            [str(accounts[0].address), PLEDGE_LIMIT])
@@ -1521,7 +2059,6 @@ def test_unlocked_amount_deducted_proportionally(earn, update_lock_time):
     earn.mint(operators[1], {'value': PLEDGE_LIMIT})
     earn.mint(operators[2], {'value': PLEDGE_LIMIT})
     turn_round(trigger=True)
-    earn.setUnDelegateValidatorState(False)
     tracker1 = get_tracker(accounts[1])
     earn.redeem(redeem_amount)
     actual_redeem_amount = redeem_amount - redeem_amount * protocol_fee // RATE_MULTIPLE
@@ -1581,6 +2118,173 @@ def test_re_balance_success(earn):
     assert earn.getValidatorDelegate(operators[0]) == earn.getValidatorDelegate(operators[2]) == PLEDGE_LIMIT * 5 // 2
 
 
+def test_re_balance_after_delegate_amounts_change(earn):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:7]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': PLEDGE_LIMIT * 4})
+    earn.mint(operators[1], {'value': PLEDGE_LIMIT * 2})
+    earn.mint(operators[2], {'value': PLEDGE_LIMIT * 3})
+    earn.mint(operators[3], {'value': PLEDGE_LIMIT * 5})
+    earn.mint(operators[1], {'value': PLEDGE_LIMIT * 6})
+    turn_round(trigger=True)
+    tx = earn.reBalance()
+    expect_event(tx, "ReBalance", {
+        "from": operators[1],
+        "to": operators[2],
+        "amount": (PLEDGE_LIMIT * 8 - PLEDGE_LIMIT * 3) // 2
+    })
+    assert earn.getValidatorDelegate(operators[1]) == earn.getValidatorDelegate(operators[2]) == PLEDGE_LIMIT * 11 // 2
+
+
+def test_batch_re_balance_until_threshold(earn):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:6]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': PLEDGE_LIMIT * 16})
+    earn.mint(operators[1], {'value': PLEDGE_LIMIT})
+    earn.mint(operators[2], {'value': PLEDGE_LIMIT})
+    turn_round(trigger=True)
+    tx = earn.batchReBalance(2)
+    assert len(tx.events['ReBalance']) == 2
+    assert tx.events['ReBalance'][0]['amount'] == PLEDGE_LIMIT * 15 // 2
+    assert tx.events['ReBalance'][1]['amount'] == (PLEDGE_LIMIT * 17 // 2 - PLEDGE_LIMIT) // 2
+    tx = earn.batchReBalance(10)
+    assert len(tx.events['ReBalance']) > 1
+    assert earn.getTotalDelegateAmount() == PLEDGE_LIMIT * 18
+    with brownie.reverts():
+        earn.reBalance()
+
+
+def test_after_turn_round_paged(earn, candidate_hub):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:7]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    for operator in operators:
+        earn.mint(operator, {'value': MIN_DELEGATE_VALUE})
+    turn_round(trigger=True)
+    candidate_hub.refuseDelegate({'from': operators[1]})
+    candidate_hub.turnRound()
+    tx = earn.afterTurnRoundPaged([], 3)
+    assert tx.return_value is False
+    assert earn.settleCursor() == 1
+    assert earn.roundTag() != candidate_hub.getRoundTag()
+    with brownie.reverts("Turn round not executed"):
+        earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE})
+    tx = earn.afterTurnRoundPaged([], 3)
+    assert tx.return_value is True
+    assert earn.settleCursor() == 0
+    assert earn.roundTag() == candidate_hub.getRoundTag()
+    assert earn.getValidatorDelegateMapLength() == 3
+    assert earn.getValidatorDelegate(operators[1]) == 0
+    assert earn.getTotalDelegateAmount() == MIN_DELEGATE_VALUE * 4
+
+
+def test_after_turn_round_paged_stops_when_gas_runs_low(earn, candidate_hub):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:7]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    for operator in operators:
+        earn.mint(operator, {'value': MIN_DELEGATE_VALUE})
+    turn_round(trigger=True)
+    candidate_hub.refuseDelegate({'from': operators[3]})
+    turn_round(consensuses)
+    candidate_hub.turnRound()
+    # the reserve of 300000 gas is reached after the first validator of the page
+    tx = earn.afterTurnRoundPaged([], 4, {'gas_limit': 340000})
+    assert tx.return_value is False
+    assert earn.settleCursor() == 3
+    tx = earn.afterTurnRoundPaged([], 4)
+    assert tx.return_value is True
+    assert earn.settleCursor() == 0
+    assert earn.roundTag() == candidate_hub.getRoundTag()
+    assert earn.getValidatorDelegateMapLength() == 3
+
+
+def test_after_turn_round_reinvests_to_least_delegated(earn, candidate_hub):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:7]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    for operator, amount in zip(operators, [3, 1, 2, 4]):
+        earn.mint(operator, {'value': MIN_DELEGATE_VALUE * amount})
+    turn_round(trigger=True)
+    tx = earn.updateReinvestValidatorCount(2)
+    expect_event(tx, "UpdateReinvestValidatorCount", {
+        "caller": accounts[0],
+        "reinvestValidatorCount": 2
+    })
+    candidate_hub.refuseDelegate({'from': operators[0]})
+    turn_round(trigger=True)
+    assert earn.getValidatorDelegate(operators[1]) == MIN_DELEGATE_VALUE * 5 // 2
+    assert earn.getValidatorDelegate(operators[2]) == MIN_DELEGATE_VALUE * 7 // 2
+    assert earn.getValidatorDelegate(operators[3]) == MIN_DELEGATE_VALUE * 4
+    earn.updateReinvestValidatorCount(1)
+    candidate_hub.refuseDelegate({'from': operators[3]})
+    turn_round(trigger=True)
+    assert earn.getValidatorDelegate(operators[1]) == MIN_DELEGATE_VALUE * 13 // 2
+    assert earn.getValidatorDelegate(operators[2]) == MIN_DELEGATE_VALUE * 7 // 2
+    assert earn.getValidatorDelegateMapLength() == 2
+
+
+def test_get_validator_delegations(earn):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:6]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    for index, operator in enumerate(operators):
+        earn.mint(operator, {'value': MIN_DELEGATE_VALUE * (index + 1)})
+    validators, amounts = earn.getValidatorDelegations(0, 10)
+    assert validators == operators
+    assert amounts == [MIN_DELEGATE_VALUE, MIN_DELEGATE_VALUE * 2, MIN_DELEGATE_VALUE * 3]
+    validators, amounts = earn.getValidatorDelegations(1, 1)
+    assert validators == [operators[1]]
+    assert amounts == [MIN_DELEGATE_VALUE * 2]
+    validators, amounts = earn.getValidatorDelegations(3, 10)
+    assert len(validators) == len(amounts) == 0
+
+
+def test_earn_lens_state(earn, stcore, update_lock_time):
+    lens = EarnLens.deploy({'from': accounts[0]})
+    operators = []
+    consensuses = []
+    for operator in accounts[3:5]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE * 2})
+    earn.redeem(MIN_DELEGATE_VALUE)
+    state, account_state = lens.getState(earn.address, accounts[0])
+    assert state['roundTag'] == earn.roundTag()
+    assert state['exchangeRate'] == RATE_MULTIPLE
+    assert state['totalDelegateAmount'] == MIN_DELEGATE_VALUE
+    assert state['toWithdrawAmount'] == MIN_DELEGATE_VALUE
+    assert state['stCoreTotalSupply'] == stcore.totalSupply() == MIN_DELEGATE_VALUE
+    assert state['pledgeAgentLimit'] == earn.pledgeAgentLimit()
+    assert state['paused'] is False
+    assert account_state['stCoreBalance'] == MIN_DELEGATE_VALUE
+    assert account_state['unlockedAmount'] == MIN_DELEGATE_VALUE
+    assert account_state['lockedAmount'] == 0
+    account_states = lens.getAccountStates(earn.address, [accounts[0], accounts[1]])
+    assert account_states[1]['stCoreBalance'] == 0
+
+
 def test_remove_validator_from_map_logic(earn, candidate_hub, stcore):
     operators = []
     consensuses = []
@@ -1803,7 +2507,6 @@ def test_redeem_exceed_total_rewards_and_principal(earn, update_lock_time):
     turn_round()
     earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE})
     turn_round(trigger=True)
-    earn.setUnDelegateValidatorState(False)
     earn.setValidatorDelegateMap(operators[0], 1, False)
     earn.redeem(MIN_DELEGATE_VALUE)
     error_msg = encode_args_with_signature("EarnUnDelegateFailedFinally(address,uint256)",
@@ -1843,12 +2546,9 @@ def test_redeem_full_map_iteration(earn, candidate_hub, pledge_agent, update_loc
     earn.setValidatorDelegateMap(operators[4], MIN_DELEGATE_VALUE, False)
     turn_round(consensuses)
     earn.setContractAddress(candidate_hub.address, pledge_agent.address, candidate_hub.getRoundTag())
-    earn.setUnDelegateValidatorState(False)
-    earn.setUnDelegateValidatorIndex(3)
     earn.redeem(MIN_DELEGATE_VALUE // 2, {'from': accounts[0]})
     earn.withdraw()
-    assert earn.getValidatorDelegateIndex(3) == MIN_DELEGATE_VALUE - MIN_DELEGATE_VALUE // 2
-    earn.setUnDelegateValidatorIndex(3)
+    assert earn.getValidatorDelegateIndex(2) == MIN_DELEGATE_VALUE - MIN_DELEGATE_VALUE // 2
     earn.redeem(MIN_DELEGATE_VALUE * 2.5, {'from': accounts[0]})
     earn.withdraw()
     assert earn.getValidatorDelegateIndex(3) == 0
@@ -2054,7 +2754,7 @@ def test_re_balance_with_reward_to_reinvest(earn, pledge_agent):
     turn_round(trigger=True)
     error_msg = encode_args_with_signature(
         "EarnReBalanceNoNeed(address,address)",
-        [str(operators[0].address), str(operators[0].address)])
+        [str(operators[0].address), str(operators[1].address)])
     with brownie.reverts(f"typed error: {error_msg}"):
         earn.reBalance()
     turn_round(consensuses, trigger=True)
@@ -2559,6 +3259,73 @@ def test_contract_upgrade_successful(earn, stcore, candidate_hub):
     assert validator_delegate == MIN_DELEGATE_VALUE + BLOCK_REWARD // 2
 
 
+def test_upgrade_from_first_version(stcore, candidate_hub, pledge_agent):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:6]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    legacy_earn = EarnV1Mock.deploy({'from': accounts[0]})
+    raw_data = transaction_raw_data('initialize(address,address,address)', ['address', 'address', 'address'],
+                                    [stcore.address, accounts[-2].address, accounts[0].address])
+    proxy = EarnProxy.deploy(legacy_earn, raw_data, {'from': accounts[0]})
+    legacy_earn = Contract.from_abi('legacy_earn', proxy.address, legacy_earn.abi)
+    legacy_earn.developmentInit()
+    legacy_earn.setContractAddress(candidate_hub.address, pledge_agent.address, candidate_hub.getRoundTag())
+    legacy_earn.setProtocolFeePoints(1000)
+    legacy_earn.delegate(operators[0], {'value': MIN_DELEGATE_VALUE * 3})
+    legacy_earn.delegate(operators[1], {'value': MIN_DELEGATE_VALUE})
+    legacy_earn.delegate(operators[2], {'value': MIN_DELEGATE_VALUE * 2})
+    rates = [1010000, 1020000, 1030000]
+    for rate in rates:
+        legacy_earn.pushExchangeRate(rate)
+    now = chain.time()
+    # the first version reorders records by swap-and-pop on withdraw
+    legacy_earn.pushRedeemRecord(accounts[1], now + 3000, PLEDGE_LIMIT * 3)
+    legacy_earn.pushRedeemRecord(accounts[1], now + 1000, PLEDGE_LIMIT)
+    legacy_earn.pushRedeemRecord(accounts[1], now + 2000, PLEDGE_LIMIT * 2)
+
+    new_earn = EarnMock.deploy({'from': accounts[0]})
+    legacy_earn.upgradeToAndCall(new_earn.address, transaction_raw_data('initializeV2()', [], []))
+    upgraded_earn = Contract.from_abi('upgraded_earn', proxy.address, new_earn.abi)
+    with brownie.reverts("Initializable: contract is already initialized"):
+        upgraded_earn.initializeV2()
+    assert upgraded_earn.getTotalDelegateAmount() == MIN_DELEGATE_VALUE * 6
+    assert list(upgraded_earn.getValidatorDelegateSortedKeys()) == [operators[1], operators[2], operators[0]]
+    assert upgraded_earn.getValidatorDelegate(operators[0]) == MIN_DELEGATE_VALUE * 3
+    assert upgraded_earn.balanceThreshold() == upgraded_earn.mintMinLimit() == upgraded_earn.redeemMinLimit() == \
+           upgraded_earn.pledgeAgentLimit() == PLEDGE_LIMIT
+    assert upgraded_earn.lockDay() == LOCK_DAY
+    assert upgraded_earn.protocolFeePoints() == 1000
+    assert upgraded_earn.redeemCountLimit() == 100
+    assert upgraded_earn.exchangeRateQueryLimit() == 365
+    assert upgraded_earn.roundTag() == candidate_hub.getRoundTag()
+    assert upgraded_earn.toWithdrawAmount() == PLEDGE_LIMIT * 6
+    assert upgraded_earn.getCurrentExchangeRate() == rates[-1]
+    assert list(upgraded_earn.getExchangeRates(10)) == [RATE_MULTIPLE] + rates
+    round_tag = upgraded_earn.roundTag()
+    rounds, _ = upgraded_earn.getExchangeRatesByRound(1, round_tag)
+    assert len(rounds) == 0
+    error_msg = encode_args_with_signature("EarnExchangeRateNotFound(uint256)", [round_tag])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        upgraded_earn.getExchangeRateAt(round_tag)
+    assert upgraded_earn.exchangeRates(0) == RATE_MULTIPLE
+    assert upgraded_earn.exchangeRates(3) == rates[-1]
+
+    chain.sleep(1500)
+    tracker1 = get_tracker(accounts[1])
+    upgraded_earn.withdraw({'from': accounts[1]})
+    assert tracker1.delta() == PLEDGE_LIMIT
+    redeem_records = upgraded_earn.getRedeemRecords(accounts[1])
+    assert [record[1] for record in redeem_records] == [now + 2000, now + 3000]
+    chain.sleep(1000)
+    upgraded_earn.withdraw({'from': accounts[1]})
+    assert tracker1.delta() == PLEDGE_LIMIT * 2
+    assert upgraded_earn.getRedeemRecords(accounts[1])[0][2] == PLEDGE_LIMIT * 3
+    assert upgraded_earn.toWithdrawAmount() == PLEDGE_LIMIT * 3
+
+
 def test_update_successful(earn):
     update_value = 100000
     earn.updateBalanceThreshold(update_value)
@@ -2578,6 +3345,17 @@ def test_update_successful(earn):
     assert earn.operator() == earn.protocolFeeReceiver() == accounts[0]
 
 
+def test_update_limit_exceeds_packed_size(earn):
+    with brownie.reverts("SafeCast: value doesn't fit in 72 bits"):
+        earn.updateMintMinLimit(2 ** 72)
+    with brownie.reverts("SafeCast: value doesn't fit in 24 bits"):
+        earn.updateLockDay(2 ** 24)
+    with brownie.reverts("SafeCast: value doesn't fit in 24 bits"):
+        earn.updateRedeemCountLimit(2 ** 24)
+    earn.updateRedeemMinLimit(2 ** 72 - 1)
+    assert earn.redeemMinLimit() == 2 ** 72 - 1
+
+
 def test_query_specific_record(earn):
     operators = []
     consensuses = []
@@ -2605,6 +3383,149 @@ def test_query_specific_record(earn):
     assert redeem_amount['unlockedAmount'] == withdraw_amount // 4
 
 
+def test_redeem_amount_from_running_totals(earn, update_lock_time):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:5]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE * 3})
+    earn.redeem(MIN_DELEGATE_VALUE)
+    earn.redeem(MIN_DELEGATE_VALUE // 2)
+    earn.setDayInterval(INIT_DAY_INTERVAL)
+    earn.redeem(MIN_DELEGATE_VALUE // 4)
+    redeem_amount = earn.getRedeemAmount(accounts[0])
+    assert redeem_amount['unlockedAmount'] == MIN_DELEGATE_VALUE * 3 // 2
+    assert redeem_amount['lockedAmount'] == MIN_DELEGATE_VALUE // 4
+    earn.withdraw()
+    redeem_amount = earn.getRedeemAmount(accounts[0])
+    assert redeem_amount['unlockedAmount'] == 0
+    assert redeem_amount['lockedAmount'] == MIN_DELEGATE_VALUE // 4
+    assert earn.getRedeemRecords(accounts[0])[0][2] == MIN_DELEGATE_VALUE // 4
+
+
+def test_get_redeem_records_paged_by_lock_status(earn, update_lock_time):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:5]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE * 10})
+    for i in range(1, 4):
+        earn.redeem(MIN_DELEGATE_VALUE * i)
+    earn.setDayInterval(INIT_DAY_INTERVAL)
+    earn.redeem(MIN_DELEGATE_VALUE // 4)
+    chain.sleep(INIT_DAY_INTERVAL)
+    earn.redeem(MIN_DELEGATE_VALUE // 5)
+    get_page = earn.getRedeemRecords['address,uint256,uint256']
+    records = get_page(accounts[0], 1, 3)
+    assert [record[2] for record in records] == [MIN_DELEGATE_VALUE * 2, MIN_DELEGATE_VALUE * 3, MIN_DELEGATE_VALUE // 4]
+    assert len(get_page(accounts[0], 5, 3)) == 0
+    unlocked_records = earn.getRedeemRecordsByLockStatus(accounts[0], True, 1, 10)
+    assert [record[2] for record in unlocked_records] == [MIN_DELEGATE_VALUE * 2, MIN_DELEGATE_VALUE * 3]
+    locked_records = earn.getRedeemRecordsByLockStatus(accounts[0], False, 0, 1)
+    assert [record[2] for record in locked_records] == [MIN_DELEGATE_VALUE // 4]
+    earn.withdraw()
+    assert len(earn.getRedeemRecordsByLockStatus(accounts[0], True, 0, 10)) == 0
+    assert len(earn.getRedeemRecordsByLockStatus(accounts[0], False, 0, 10)) == 2
+
+
+def test_redeem_merges_records_unlocking_on_same_day(earn, update_lock_time):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:5]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE * 3})
+    earn.updateRedeemCountLimit(2)
+    protocol_fee = 200000
+    earn.updateProtocolFeePoints(protocol_fee)
+    earn.setDayInterval(INIT_DAY_INTERVAL)
+    chain.sleep(INIT_DAY_INTERVAL - chain.time() % INIT_DAY_INTERVAL + 100)
+    for _ in range(3):
+        earn.redeem(MIN_DELEGATE_VALUE // 2)
+    tx = earn.redeem(MIN_DELEGATE_VALUE // 2)
+    redeem_records = earn.getRedeemRecords(accounts[0])
+    assert len(redeem_records) == 1
+    assert redeem_records[0][1] == tx.timestamp + INIT_DAY_INTERVAL * LOCK_DAY - 10
+    assert redeem_records[0][2] == MIN_DELEGATE_VALUE * 2 - MIN_DELEGATE_VALUE * 2 * protocol_fee // RATE_MULTIPLE
+    assert redeem_records[0][3] == MIN_DELEGATE_VALUE * 2
+    assert redeem_records[0][4] == MIN_DELEGATE_VALUE * 2 * protocol_fee // RATE_MULTIPLE
+    chain.sleep(INIT_DAY_INTERVAL)
+    earn.redeem(MIN_DELEGATE_VALUE // 2)
+    assert len(earn.getRedeemRecords(accounts[0])) == 2
+    chain.sleep(INIT_DAY_INTERVAL)
+    error_msg = encode_args_with_signature("EarnRedeemCountOverLimit(address,uint256,uint256)",
+                                           [accounts[0].address, 2, 2])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.redeem(MIN_DELEGATE_VALUE // 2)
+    redeem_amount = earn.getRedeemAmount(accounts[0])
+    assert redeem_amount['lockedAmount'] == MIN_DELEGATE_VALUE * 5 // 2 - MIN_DELEGATE_VALUE * 5 // 2 * protocol_fee // RATE_MULTIPLE
+
+
+def test_withdraw_committed_redeem_records(earn, update_lock_time):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:5]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    earn.mint(operators[0], {'value': MIN_DELEGATE_VALUE * 3})
+    records = []
+    tx = earn.redeemCommitted(MIN_DELEGATE_VALUE)
+    records.append(tx.events['CommitRedeemRecord']['record'])
+    earn.setDayInterval(INIT_DAY_INTERVAL)
+    tx = earn.redeemCommitted(MIN_DELEGATE_VALUE // 2)
+    records.append(tx.events['CommitRedeemRecord']['record'])
+    assert earn.getRedeemCommitment(accounts[0]) == (tx.events['CommitRedeemRecord']['commitment'],
+                                                     MIN_DELEGATE_VALUE * 3 // 2, 2)
+    assert len(earn.getRedeemRecords(accounts[0])) == 0
+    forged_record = list(records[0])
+    forged_record[2] = MIN_DELEGATE_VALUE * 2
+    error_msg = encode_args_with_signature("EarnRedeemCommitmentMismatch(address)", [accounts[0].address])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.withdrawCommitted([forged_record, records[1]])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.withdrawCommitted([records[0]])
+    tracker = get_tracker(accounts[0])
+    tx = earn.withdrawCommitted(records)
+    expect_event(tx, "Withdraw", {
+        "account": accounts[0],
+        "amount": MIN_DELEGATE_VALUE
+    })
+    assert tracker.delta() == MIN_DELEGATE_VALUE
+    assert earn.toWithdrawAmount() == MIN_DELEGATE_VALUE // 2
+    assert earn.getRedeemCommitment(accounts[0])[1:] == (MIN_DELEGATE_VALUE // 2, 1)
+    error_msg = encode_args_with_signature("EarnRedeemRecordNotFound(address)", [accounts[0].address])
+    with brownie.reverts(f"typed error: {error_msg}"):
+        earn.withdrawCommitted([records[1]])
+
+
+def test_total_delegate_amount_tracks_delegate_records(earn, candidate_hub, update_lock_time):
+    operators = []
+    consensuses = []
+    for operator in accounts[3:6]:
+        operators.append(operator)
+        consensuses.append(register_candidate(operator=operator))
+    turn_round()
+    for operator in operators:
+        earn.mint(operator, {'value': MIN_DELEGATE_VALUE * 2})
+    assert earn.getTotalDelegateAmount() == MIN_DELEGATE_VALUE * 6
+    earn.redeem(MIN_DELEGATE_VALUE)
+    earn.withdraw()
+    assert earn.getTotalDelegateAmount() == MIN_DELEGATE_VALUE * 5
+    turn_round(trigger=True)
+    candidate_hub.refuseDelegate({'from': operators[1]})
+    turn_round(consensuses, trigger=True)
+    total_delegate_amount = 0
+    for i in range(earn.getValidatorDelegateMapLength()):
+        total_delegate_amount += earn.getValidatorDelegateIndex(i)
+    assert earn.getTotalDelegateAmount() == total_delegate_amount
+
+
 def test_random_validator_undelegate_successful(earn, update_lock_time):
     operators = []
     consensuses = []
@@ -2663,7 +3584,6 @@ def test_fuzz_undelegate_coin(earn, redeem_amount, mint_amount0, mint_amount1):
     }
     earn.setDayInterval(0)
     earn.setReduceTime(10)
-    earn.setUnDelegateValidatorState(False)
     withdraw_amount = redeem_amount
     if redeem_amount > (mint_amount0 + mint_amount1):
         with brownie.reverts('ERC20: burn amount exceeds balance'):
@@ -2672,25 +3592,9 @@ def test_fuzz_undelegate_coin(earn, redeem_amount, mint_amount0, mint_amount1):
     else:
         earn.redeem(redeem_amount)
         assert earn.getRedeemRecords(accounts[0])[0][2] == earn.getRedeemRecords(accounts[0])[0][3] == redeem_amount
-        for i in validator_map:
-            validator_amount = validator_map[i]
-            if redeem_amount == validator_amount:
-                redeem_amount = 0
-                break
-            elif redeem_amount < validator_amount:
-                if validator_amount >= redeem_amount + PLEDGE_LIMIT:
-                    redeem_amount = 0
-                    break
-                else:
-                    undelegate_amount = redeem_amount - PLEDGE_LIMIT
-                    if undelegate_amount > PLEDGE_LIMIT:
-                        redeem_amount -= undelegate_amount
-            else:
-                if redeem_amount >= validator_amount + PLEDGE_LIMIT:
-                    redeem_amount -= validator_amount
-                else:
-                    if (validator_amount - PLEDGE_LIMIT) > PLEDGE_LIMIT:
-                        redeem_amount -= (validator_amount - PLEDGE_LIMIT)
+        # the validator minted later is placed first among validators with the same amount
+        keys = [operators[1], operators[0]] if mint_amount1 <= mint_amount0 else [operators[0], operators[1]]
+        redeem_amount, _ = trial_undelegate(keys, validator_map, redeem_amount, PLEDGE_LIMIT)
         tracker0 = get_tracker(accounts[0])
         if redeem_amount > 0:
             error_msg = encode_args_with_signature("EarnUnDelegateFailedFinally(address,uint256)",
@@ -2749,7 +3653,7 @@ def test_fuzz_re_balance(earn, mint_amount0, mint_amount1, balance_threshold):
     from_amount = mint_amount0
     if mint_amount0 == mint_amount1:
         error_msg = encode_args_with_signature("EarnReBalanceNoNeed(address,address)",
-                                               [str(operators[0]), str(operators[0])])
+                                               [str(operators[0]), str(operators[1])])
         with brownie.reverts(f"typed error: {error_msg}"):
             earn.reBalance()
     elif abs(diff) < balance_threshold:
@@ -5,7 +5,7 @@ from collections import defaultdict
 import brownie
 from brownie import accounts, history
 from brownie.test import strategy
-from .common import turn_round, register_candidate, get_exchangerate
+from .common import turn_round, register_candidate, get_exchangerate, trial_undelegate
 from .utils import get_tracker, encode_args_with_signature
 from web3 import Web3
 
@@ -41,7 +41,7 @@ class Agent:
             self.agents_map[str(agent)]['status'] = status
         return self.agents_map
 
-    def redeem_coin(self, delegator, tx, core, st_core, fee, unlock_time):
+    def redeem_coin(self, delegator, tx, core, st_core, fee, unlock_time, day_interval):
         record = {
             'redeemTime': tx.timestamp - DEDUCT_DURATION,
             'unlockTime': tx.timestamp + unlock_time - DEDUCT_DURATION,
@@ -49,10 +49,23 @@ class Agent:
             'stCore': st_core,
             'protocolFee': fee
         }
-        if delegator not in self.redeem_records:
+        records = self.redeem_records.get(delegator, [])
+        if len(records) == 0:
             self.redeem_records[delegator] = [record]
+            return
+        last = records[-1]
+        if day_interval != 0 and last['unlockTime'] // day_interval == record['unlockTime'] // day_interval:
+            # redemptions unlocking in the same day are merged into the last record
+            last['unlockTime'] = max(last['unlockTime'], record['unlockTime'])
+            last['amount'] += core
+            last['stCore'] += st_core
+            last['protocolFee'] += fee
         else:
-            self.redeem_records[delegator].append(record)
+            # records unlocking earlier than the last ones are queued before them
+            index = len(records)
+            while index > 0 and records[index - 1]['unlockTime'] > record['unlockTime']:
+                index -= 1
+            records.insert(index, record)
 
     def withdraw_coin(self, delegate, new_redeem_record):
         self.redeem_records[delegate] = new_redeem_record
@@ -128,8 +141,6 @@ class StateMachine:
         random_num = random.randint(0, 1)
         if random_num == 0:
             self.new_elected_validators.append(random.choice(self.candidate_hub.getCanDelegateCandidates()))
-        self.earn.setUnDelegateValidatorState(False)
-        self.earn.setUnDelegateValidatorIndex(0)
 
     def rule_mint_coin(self, st_mint_amount):
         delegator = random.choice(self.operating)
@@ -171,7 +182,7 @@ class StateMachine:
             tx = self.earn.redeem(value, {'from': delegator})
             core = value * self.rate // RATE_MULTIPLE
             protocol_fee = core * self.protocol_fee_points // RATE_MULTIPLE
-            self.__redeem_coin(delegator, tx, core - protocol_fee, value, protocol_fee, unlock_time)
+            self.__redeem_coin(delegator, tx, core - protocol_fee, value, protocol_fee, unlock_time, st_unlock_time)
         print(f"[END REDEEM COIN] >>>   state:{msg}  delegator:{delegator}  redeem_amount:{value}")
 
     def rule_withdraw_coin(self):
@@ -189,14 +200,13 @@ class StateMachine:
         else:
             redeem_array = self.redeem_record[delegator]
             copy_redeem_array = copy(redeem_array)
-            for index in range(len(redeem_array) - 1, -1, -1):
-                record = redeem_array[index]
+            for record in redeem_array:
                 block_high_time = history[-1].timestamp
-                if record['unlockTime'] < block_high_time:
-                    account_amount += record['amount']
-                    protocol_fee_amount += record['protocolFee']
-                    copy_redeem_array[index], copy_redeem_array[-1] = copy_redeem_array[-1], copy_redeem_array[index]
-                    copy_redeem_array.pop()
+                if record['unlockTime'] >= block_high_time:
+                    break
+                account_amount += record['amount']
+                protocol_fee_amount += record['protocolFee']
+                copy_redeem_array.pop(0)
             if account_amount == 0:
                 msg = "EarnRedeemRecordNotFound(address)"
                 error_msg = encode_args_with_signature(msg, [delegator.address])
@@ -271,9 +281,10 @@ class StateMachine:
                     min_coin = validator_coin
                     min_validator = validator
             if max_validator == min_validator:
+                # All validators have the same amount, the contract reports the keys at both ends of its sorted list
                 msg = "EarnReBalanceNoNeed(address,address)"
-                error_msg = encode_args_with_signature(msg, [max_validator, min_validator])
-                with brownie.reverts(f"typed error: {error_msg}"):
+                error_msg = encode_args_with_signature(msg, [])
+                with brownie.reverts(revert_pattern=f"typed error: {error_msg}.*"):
                     self.earn.reBalance()
             elif max_coin - min_coin < self.balance_threshold:
                 msg = "EarnReBalanceAmountDifferenceLessThanThreshold(address,address,uint256,uint256,uint256)"
@@ -420,9 +431,9 @@ class StateMachine:
         Token(self.token_holder).mint_token(delegator, amount, self.rate)
         Agent(self.agents, self.redeem_record).add_coin(agent, amount, status=Status.ACTIVE)
 
-    def __redeem_coin(self, delegator, tx, core, st_core, fee, unlock_time):
+    def __redeem_coin(self, delegator, tx, core, st_core, fee, unlock_time, day_interval):
         Token(self.token_holder).burn_token(delegator, st_core)
-        Agent(self.agents, self.redeem_record).redeem_coin(delegator, tx, core, st_core, fee, unlock_time)
+        Agent(self.agents, self.redeem_record).redeem_coin(delegator, tx, core, st_core, fee, unlock_time, day_interval)
         self.to_withdraw_amount += core + fee
 
     def __withdraw_coin(self, delegator, amount, protocol_fee_amount):
@@ -460,39 +471,9 @@ class StateMachine:
             self.trackers[address] = get_tracker(address)
 
     def __trial_withdraw_coin(self, amount):
-        pledge_limit = self.pledge_limit
-        redeem_amount = amount
-        deduction = {}
-        for agent in self.agents:
-            validator_amount = self.agents[agent]['coin']
-            if validator_amount == 0:
-                continue
-            if redeem_amount == validator_amount:
-                redeem_amount = 0
-                deduction[agent] = validator_amount
-                break
-            elif redeem_amount < validator_amount:
-                if validator_amount >= redeem_amount + pledge_limit:
-                    deduction[agent] = redeem_amount
-                    redeem_amount = 0
-                    break
-                else:
-                    undelegate_amount = redeem_amount - pledge_limit
-                    if undelegate_amount > pledge_limit:
-                        redeem_amount -= undelegate_amount
-                        deduction[agent] = undelegate_amount
-
-            else:
-                if redeem_amount >= validator_amount + pledge_limit:
-                    redeem_amount -= validator_amount
-                    deduction[agent] = validator_amount
-
-                else:
-                    if (validator_amount - pledge_limit) > pledge_limit:
-                        redeem_amount -= (validator_amount - pledge_limit)
-                        deduction[agent] = validator_amount - pledge_limit
-
-        return redeem_amount, deduction
+        keys = self.earn.getValidatorDelegateSortedKeys()
+        amounts = {agent: self.agents[agent]['coin'] for agent in keys}
+        return trial_undelegate(keys, amounts, amount, self.pledge_limit)
 
 
 def test_stateful(state_machine, earn, stcore,
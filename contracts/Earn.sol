@@ -7,9 +7,13 @@ import "./interface/ISTCore.sol";
 import "./interface/IPledgeAgent.sol";
 
 import "./lib/IterableAddressDelegateMapping.sol";
+import "./lib/RedeemRecordQueue.sol";
+import "./lib/WithdrawalQueue.sol";
+import "./lib/ExchangeRateRingBuffer.sol";
 import "./lib/Structs.sol";
 
 import "@openzeppelin/contracts/utils/Address.sol";
+import "@openzeppelin/contracts/utils/math/SafeCast.sol";
 import "@openzeppelin/contracts/token/ERC20/IERC20.sol";
 
 import "@openzeppelin/contracts-upgradeable/proxy/utils/Initializable.sol";
@@ -25,7 +29,11 @@ import "@openzeppelin/contracts-upgradeable/security/PausableUpgradeable.sol";
  */
 contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradeable, PausableUpgradeable, UUPSUpgradeable {
     using IterableAddressDelegateMapping for IterableAddressDelegateMapping.Map;
+    using RedeemRecordQueue for RedeemRecordQueue.Queue;
+    using WithdrawalQueue for WithdrawalQueue.Queue;
+    using ExchangeRateRingBuffer for ExchangeRateRingBuffer.Buffer;
     using Address for address payable;
+    using SafeCast for uint256;
 
     // Exchange rate base 
     // 10^6 is used to enhance precision in calculations
@@ -43,56 +51,149 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
     // https://github.com/coredao-org/core-genesis-contract/blob/master/contracts/CandidateHub.sol
     uint256 public constant VALIDATOR_ACTIVE_STATUS = 17;
 
+    // Gas kept in reserve by {batchReBalance()} before starting another transfer
+    uint256 private constant REBALANCE_GAS_RESERVE = 300000;
+
+    // Gas kept in reserve by {afterTurnRoundPaged()} before settling another validator
+    uint256 private constant SETTLE_GAS_RESERVE = 300000;
+
     // Address of stCORE contract: STCORE
     address public STCORE; 
 
-    // Exchange rate (conversion rate between stCORE and CORE)
-    // Exchange rate is calculated and updated at the beginning of each round
-    uint256[] public exchangeRates;
+    // Latest exchange rate, equals to the latest entry of {exchangeRateHistory}
+    // Packed into the slot of {STCORE}, both are read by mint and redeem
+    uint96 private currentExchangeRate;
 
-    // Delegate records on each validator from the Earn contract
-    IterableAddressDelegateMapping.Map private validatorDelegateMap;
+    // Exchange rates recorded before the round indexed history was introduced
+    // Deprecated, the latest rates are copied to {exchangeRateHistory} in {initializeV2}
+    // {exchangeRates()} reads the rates by the same index from {exchangeRateHistory}
+    uint256[] private legacyExchangeRates;
 
-    // Redemption period
-    // It takes {lockDay} days for users to get CORE back from Earn after requesting redeem
-    uint256 public lockDay;
+    // Delegate records on each validator from the Earn contract before the running total was introduced
+    // Records are moved to {validatorDelegateMap} in {initializeV2}, the slot is kept to preserve storage layout
+    IterableAddressDelegateMapping.LegacyMap private legacyValidatorDelegateMap;
+
+    // Deprecated, moved to {lockDay}
+    uint256 private legacyLockDay;
 
-    // Redeem records are saved for each user
-    // The records been withdrawn are removed to improve iteration performance
-    mapping(address => RedeemRecord[]) public redeemRecords;
+    // Redeem records saved for each user before the redeem queue was introduced
+    // Records are moved to {redeemQueues} the first time the user redeems or withdraws after the upgrade
+    mapping(address => RedeemRecord[]) private legacyRedeemRecords;
 
     // The threshold to tigger rebalance
     uint256 public balanceThreshold;
 
     // Dues protections
-    uint256 public mintMinLimit;
-    uint256 public redeemMinLimit;
+    // Deprecated, moved to {mintMinLimit} and {redeemMinLimit}
+    uint256 private legacyMintMinLimit;
+    uint256 private legacyRedeemMinLimit;
     uint256 public pledgeAgentLimit;
 
-    // Protocol fee percents and fee receiving address
-    // Set 0 ~ 1000000
-    // 1000000 = 100%
-    uint256 public protocolFeePoints;
+    // Deprecated, moved to {protocolFeePoints}
+    uint256 private legacyProtocolFeePoints;
+
+    // Protocol fee receiving address
     address public protocolFeeReceiver;
 
     // The operator address to trigger afterTurnRound() and rebalance methods
     address public operator;
 
-    // roundTag of Core blockchain
-    uint256 public roundTag;
-
-    // Length limit of RedeemRecord[]
-    // A user can keep up to {redeemCountLimit} redeem records
-    // This is introduced to avoid gas issue when users withdraw CORE from this contract
-    uint256 public redeemCountLimit;
+    // Deprecated, moved to {roundTag} and {redeemCountLimit}
+    uint256 private legacyRoundTag;
+    uint256 private legacyRedeemCountLimit;
 
-    // Query limit of exchangeRates
+    // Query limit of exchange rate history
     // A caller can query at most {exchangeRateQueryLimit} rounds 
     uint256 public exchangeRateQueryLimit;
 
     // The amount of CORE which are requested for redumption but not yet undelegated from PledgeAgent
     uint256 public toWithdrawAmount;
 
+    // Delegate records on each validator from the Earn contract
+    // The sum of all delegate amounts is tracked by the map and validators are kept sorted by delegate amount
+    IterableAddressDelegateMapping.Map private validatorDelegateMap;
+
+    // Redeem records are saved for each user in order of unlock time
+    // The records been withdrawn are popped from the front of the queue
+    // Records are stored as {PackedRedeemRecord} in 2 slots, the queue keeps running totals of amounts
+    mapping(address => RedeemRecordQueue.Queue) private redeemQueues;
+
+    // The following fields share one slot, read by mint and redeem
+
+    // roundTag of Core blockchain
+    uint32 public roundTag;
+
+    // Protocol fee percents
+    // Set 0 ~ 1000000
+    // 1000000 = 100%
+    uint24 public protocolFeePoints;
+
+    // Length limit of redeem records
+    // A user can keep up to {redeemCountLimit} redeem records
+    // This is introduced to avoid gas issue when users withdraw CORE from this contract
+    uint24 public redeemCountLimit;
+
+    // Redemption period
+    // It takes {lockDay} days for users to get CORE back from Earn after requesting redeem
+    uint24 public lockDay;
+
+    // Dues protections
+    uint72 public mintMinLimit;
+    uint72 public redeemMinLimit;
+
+    // Exchange rate (conversion rate between stCORE and CORE) of each round
+    // Exchange rate is calculated and updated at the beginning of each round
+    // Rounds without a rate update are skipped, the latest {ExchangeRateRingBuffer.CAPACITY} rates are kept
+    ExchangeRateRingBuffer.Buffer private exchangeRateHistory;
+
+    // The following fields share one slot, read and written by mint in buffer mode and by withdraw
+
+    // The amount of CORE minted but not yet delegated to PledgeAgent
+    uint128 public pendingDelegateAmount;
+
+    // If enabled, minted CORE is kept in the contract and delegated in batches
+    //  by {afterTurnRound()} or {flushPendingDelegations()}
+    bool public mintBufferEnabled;
+
+    // The amount of CORE kept in the contract to serve withdrawals
+    // In buffer mode rewards claimed in {afterTurnRound()} are kept up to {withdrawReserveLimit} and {toWithdrawAmount}
+    uint120 public withdrawReserve;
+
+    // Validators chosen by users in buffer mode and the amount to delegate to each of them
+    address[] private pendingValidators;
+    mapping(address => uint256) private pendingDelegations;
+
+    // Progress of {afterTurnRoundPaged()}
+    // Validators at positions [0, settleCursor) of {validatorDelegateMap} are not processed yet in {settlingRound}
+    uint32 public settlingRound;
+    uint32 public settleCursor;
+
+    // Number of validators with the least delegate amounts which share rewards reinvested in {afterTurnRound()}
+    // 0 means rewards are delegated to a randomly chosen validator
+    // Packed into the slot of {settlingRound}
+    uint8 public reinvestValidatorCount;
+
+    // Upper bound of {withdrawReserve} filled by rewards claimed in {afterTurnRound()}
+    // {toWithdrawAmount} includes redemptions still locked for up to {lockDay} days,
+    //  the bound is set around the withdrawals expected in a round so that the rest of rewards is reinvested
+    // 0 means all rewards are reinvested, packed into the slot of {settlingRound}
+    uint120 public withdrawReserveLimit;
+
+    // Protocol-wide queue of redemptions made by {requestWithdrawal()}
+    // Unlike {redeemQueues} it has no per account limit
+    WithdrawalQueue.Queue private withdrawalQueue;
+
+    // The amount of CORE set aside for finalized withdrawal requests which are not claimed yet
+    uint256 public claimableAmount;
+
+    // Commitments to the redeem records made by {redeemCommitted()}
+    // Records are not stored, they are emitted in {CommitRedeemRecord} and passed back to {withdrawCommitted()}
+    mapping(address => RedeemCommitment) private redeemCommitments;
+
+    // New elected validators passed to {afterTurnRound()} which are not delegated by Earn yet
+    // Recorded once a round so that {mintToLeastDelegated()} considers them without looking through all candidates
+    address[] private newValidators;
+
     /// --- EVENTS --- ///
 
     // User operations events
@@ -102,10 +203,15 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
     event Redeem(address indexed account, uint256 stCore, uint256 core, uint256 protocolFee);
     event Withdraw(address indexed account, uint256 amount, uint256 protocolFee);
     event Transfer(address indexed from, address indexed to, uint256 amount);
+    event RequestWithdrawal(address indexed account, uint256 indexed requestId, uint256 stCore, uint256 core, uint256 protocolFee);
+    event FinalizeWithdrawals(uint256 fromRequestId, uint256 toRequestId, uint256 amount, uint256 protocolFee);
+    event ClaimWithdrawal(address indexed account, uint256 indexed requestId, uint256 amount);
+    event CommitRedeemRecord(address indexed account, bytes32 commitment, RedeemRecord record);
 
     // Operator operations events
     event CalculateExchangeRate(uint256 round, uint256 exchangeRate);
     event ReBalance(address indexed from, address indexed to, uint256 amount);
+    event FlushPendingDelegations(uint256 amount);
 
     // Admin operations events
     event UpdateBalanceThreshold(address indexed caller, uint256 balanceThreshold);
@@ -118,6 +224,9 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
     event UpdateOperator(address indexed caller, address operator);
     event UpdateRedeemCountLimit(address indexed caller, uint256 redeemCountLimit);
     event UpdateExchangeRateQueryLimit(address indexed caller, uint256 exchangeRateQueryLimit);
+    event UpdateMintBufferEnabled(address indexed caller, bool mintBufferEnabled);
+    event UpdateReinvestValidatorCount(address indexed caller, uint256 reinvestValidatorCount);
+    event UpdateWithdrawReserveLimit(address indexed caller, uint256 withdrawReserveLimit);
 
     /**
      * @dev Invoke the {Initializable}.{_disableInitializers} function in the constructor
@@ -155,8 +264,9 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
         operator = _operator;
 
         // Initialize fields
-        exchangeRates.push(RATE_BASE);
-        roundTag = _currentRound();
+        currentExchangeRate = uint96(RATE_BASE);
+        roundTag = _currentRound().toUint32();
+        exchangeRateHistory.push(roundTag, RATE_BASE);
         lockDay = 7;
         balanceThreshold = 10000 ether;
         mintMinLimit = 1 ether;
@@ -168,6 +278,50 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
         toWithdrawAmount = 0;
     }
 
+    /**
+     * @dev Storage migration function, called through {upgradeToAndCall} when upgrading the existing proxy.
+     * Moves delegate records from {legacyValidatorDelegateMap} to {validatorDelegateMap}
+     * and configurations read by user interactions to packed slots.
+     */
+    function initializeV2() external reinitializer(2) onlyOwner {
+        // Legacy configurations are only set on proxies initialized by the first version
+        if (legacyMintMinLimit != 0) {
+            roundTag = legacyRoundTag.toUint32();
+            protocolFeePoints = legacyProtocolFeePoints.toUint24();
+            redeemCountLimit = legacyRedeemCountLimit.toUint24();
+            mintMinLimit = legacyMintMinLimit.toUint72();
+            redeemMinLimit = legacyRedeemMinLimit.toUint72();
+            lockDay = legacyLockDay.toUint24();
+            currentExchangeRate = legacyExchangeRates[legacyExchangeRates.length - 1].toUint96();
+
+            delete legacyRoundTag;
+            delete legacyProtocolFeePoints;
+            delete legacyRedeemCountLimit;
+            delete legacyMintMinLimit;
+            delete legacyRedeemMinLimit;
+            delete legacyLockDay;
+
+            // Rounds of legacy exchange rates are unknown since rounds without a rate push were skipped,
+            //  they are recorded with round 0
+            // Rates beyond the capacity of {exchangeRateHistory} are counted as overwritten, so the kept rates keep their indexes
+            uint256 legacyRateSize = legacyExchangeRates.length;
+            uint256 from = legacyRateSize > ExchangeRateRingBuffer.CAPACITY ? legacyRateSize - ExchangeRateRingBuffer.CAPACITY : 0;
+            exchangeRateHistory.skip(from);
+            for (uint256 i = from; i < legacyRateSize; i++) {
+                exchangeRateHistory.push(0, legacyExchangeRates[i]);
+            }
+        }
+
+        address[] memory keys = legacyValidatorDelegateMap.keys;
+        for (uint256 i = 0; i < keys.length; i++) {
+            address key = keys[i];
+            validatorDelegateMap.add(key, legacyValidatorDelegateMap.values[key]);
+            delete legacyValidatorDelegateMap.values[key];
+            delete legacyValidatorDelegateMap.indexOf[key];
+        }
+        delete legacyValidatorDelegateMap.keys;
+    }
+
     /**
      * @dev Implements {UUPSUpgradeable}.{_authorizeUpgrade()},
      * can be used to implement contract upgrade logic if needed.
@@ -196,7 +350,7 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
      * @dev Modifier to make a function callable only when validator can delegate.
      */
     modifier canDelegate(address _validator) {
-        require (ICandidateHub(CANDIDATE_HUB).canDelegate(_validator), "Can not delegate to validator");
+        require (_canDelegate(_validator), "Can not delegate to validator");
         _;
     }
     
@@ -206,24 +360,68 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
      * @dev Mint stCORE using CORE.
      * The caller needs to pass in the validator address to delegate to.
      * By doing so Earn treats existing validators/new comers equally.
+     * The validator is moved to its position in {validatorDelegateMap} from where it is,
+     * which costs gas for each validator it passes, up to all of them.
+     * Use {mintWithHint()} to position it in constant gas.
      */
     function mint(address _validator) external payable afterSettled nonReentrant whenNotPaused canDelegate(_validator) {
-        address account = msg.sender;
-        uint256 amount = msg.value;
+        _mint(msg.sender, _validator, msg.value, address(0));
+    }
 
-        // dues protection 
-        if (amount < mintMinLimit) {
-            revert IEarnErrors.EarnMintAmountTooSmall(account, amount);
+    /**
+     * @dev Mint stCORE using CORE, with a hint of the position of the validator in {validatorDelegateMap}.
+     * The hint is the validator expected right before {_validator} once CORE is delegated,
+     * see {getDelegateHint()}. A wrong hint costs more gas but is otherwise ignored.
+     */
+    function mintWithHint(address _validator, address _hint) external payable afterSettled nonReentrant whenNotPaused canDelegate(_validator) {
+        _mint(msg.sender, _validator, msg.value, _hint);
+    }
+
+    /**
+     * @dev Mint stCORE using CORE without choosing a validator.
+     * CORE is delegated to the active validator with the least amount delegated by Earn,
+     * including the amount buffered for it in buffer mode,
+     * which keeps stakes balanced and saves rebalance operations.
+     * New elected validators not delegated by Earn yet are considered first, see {newValidators}.
+     */
+    function mintToLeastDelegated() external payable afterSettled nonReentrant whenNotPaused {
+        _mint(msg.sender, _leastDelegatedValidator(), msg.value, address(0));
+    }
+
+    /**
+     * @dev Mint stCORE to many recipients using CORE, {msg.value} must equal the sum of {amounts}.
+     * CORE is delegated to the validator once and stCORE is minted to each recipient at the same rate.
+     */
+    function mintBatch(address _validator, address[] calldata recipients, uint256[] calldata amounts) external payable afterSettled nonReentrant whenNotPaused canDelegate(_validator) {
+        if (recipients.length == 0) {
+            revert IEarnErrors.EarnMintBatchEmpty();
+        }
+        if (recipients.length != amounts.length) {
+            revert IEarnErrors.EarnMintBatchLengthMismatch(recipients.length, amounts.length);
+        }
+
+        uint256 totalAmount = 0;
+        for (uint256 i = 0; i < amounts.length; i++) {
+            // dues protection 
+            if (amounts[i] < mintMinLimit) {
+                revert IEarnErrors.EarnMintAmountTooSmall(recipients[i], amounts[i]);
+            }
+            totalAmount += amounts[i];
+        }
+        if (totalAmount != msg.value) {
+            revert IEarnErrors.EarnMintBatchValueMismatch(msg.value, totalAmount);
         }
 
-        // Delegate CORE to PledgeAgent
-         _delegate(_validator, amount);
+        _delegateMinted(_validator, totalAmount, address(0));
 
-        // Mint stCORE and send to users
-        uint256 stCore = _exchangeSTCore(amount);
-        ISTCore(STCORE).mint(account, stCore);
+        // Mint stCORE and send to recipients
+        uint256 rate = currentExchangeRate;
+        for (uint256 i = 0; i < recipients.length; i++) {
+            uint256 stCore = amounts[i] * RATE_BASE / rate;
+            ISTCore(STCORE).mint(recipients[i], stCore);
 
-        emit Mint(account, amount, stCore);
+            emit Mint(recipients[i], amounts[i], stCore);
+        }
     }
 
     /**
@@ -231,27 +429,13 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
      */
     function redeem(uint256 stCore) external afterSettled nonReentrant whenNotPaused{
         address account = msg.sender;
-        RedeemRecord[] storage records = redeemRecords[account];
-        
-        if (records.length >= redeemCountLimit) {
-            revert IEarnErrors.EarnRedeemCountOverLimit(account, records.length, redeemCountLimit);
-        }
-
-        // Dues protection
-        if (stCore < redeemMinLimit) {
-            revert IEarnErrors.EarnSTCoreTooSmall(account, stCore);
-        }
-       
-        uint256 core = _exchangeCore(stCore);
-
-        // Burn stCORE
-        ISTCore(STCORE).burn(account, stCore);
+        _migrateRedeemRecords(account);
+        RedeemRecordQueue.Queue storage records = redeemQueues[account];
 
-        // Calculate protocol fee
-        uint256 protocolFee = core * protocolFeePoints / RATE_BASE;
+        (uint256 redeemAmount, uint256 protocolFee) = _burnSTCore(account, stCore);
 
         // Update redeem records
-        uint256 redeemAmount = core - protocolFee;
+        // Redemptions unlocking on the same day are merged into one record
         RedeemRecord memory redeemRecord = RedeemRecord({
             redeemTime: block.timestamp,
             unlockTime: block.timestamp + DAY_INTERVAL * lockDay,
@@ -259,62 +443,215 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
             stCore: stCore,
             protocolFee: protocolFee
         });
-        records.push(redeemRecord);
-
-        toWithdrawAmount += core;
+        if (!records.merge(redeemRecord, DAY_INTERVAL)) {
+            if (records.length() >= redeemCountLimit) {
+                revert IEarnErrors.EarnRedeemCountOverLimit(account, records.length(), redeemCountLimit);
+            }
+            records.push(redeemRecord);
+        }
 
         emit Redeem(account, stCore, redeemAmount, protocolFee);
     }
 
     /**
      * @dev Withdraw CORE tokens after redemption period.
+     * Records are queued in order of unlock time, so only the unlocked records
+     * at the front of the queue are visited.
+     * As in {mint()}, each validator undelegated from is moved down {validatorDelegateMap} from where it is.
      */
     function withdraw() external afterSettled nonReentrant {
         address account = msg.sender;
         
         // Find user redeem records
-        RedeemRecord[] storage records = redeemRecords[account];
-        if (records.length == 0) {
+        _migrateRedeemRecords(account);
+        if (redeemQueues[account].length() == 0) {
             revert IEarnErrors.EarnEmptyRedeemRecord();
         }
 
-        uint256 accountAmount = 0;
-        uint256 protocolFeeAmount = 0;
-        for (uint256 i = records.length; i != 0; i--) {
-            RedeemRecord memory record = records[i - 1];
-             if (record.unlockTime < block.timestamp) {
+        (uint256 accountAmount, uint256 protocolFeeAmount) = _popUnlockedRecords(account);
+
+        // No eligible records found
+        if (accountAmount == 0) {
+            revert IEarnErrors.EarnRedeemRecordNotFound(account);
+        }
+
+        _payWithdrawal(account, accountAmount, protocolFeeAmount);
+    }
+
+    /**
+     * @dev Withdraw CORE for the unlocked redemptions of many accounts.
+     * The amount of all accounts is undelegated together and protocol fees are paid in one transfer.
+     * Accounts without unlocked redemptions are skipped.
+     * Anyone can call this method, CORE is always sent to the accounts which made the redemptions.
+     */
+    function withdrawFor(address[] calldata accounts) external afterSettled nonReentrant {
+        uint256[] memory accountAmounts = new uint256[](accounts.length);
+        uint256[] memory protocolFeeAmounts = new uint256[](accounts.length);
+        uint256 totalAmount = 0;
+        uint256 totalProtocolFeeAmount = 0;
+        for (uint256 i = 0; i < accounts.length; i++) {
+            _migrateRedeemRecords(accounts[i]);
+            (accountAmounts[i], protocolFeeAmounts[i]) = _popUnlockedRecords(accounts[i]);
+            totalAmount += accountAmounts[i] + protocolFeeAmounts[i];
+            totalProtocolFeeAmount += protocolFeeAmounts[i];
+        }
+
+        // No eligible records found
+        if (totalAmount == 0) {
+            revert IEarnErrors.EarnWithdrawForNoUnlockedRecord();
+        }
+
+        _prepareWithdrawal(totalAmount);
+
+        // Transfer CORE to users
+        for (uint256 i = 0; i < accounts.length; i++) {
+            if (accountAmounts[i] != 0) {
+                payable(accounts[i]).sendValue(accountAmounts[i]);
+                emit Withdraw(accounts[i], accountAmounts[i], protocolFeeAmounts[i]);
+            }
+        }
+
+        // Transfer CORE to porotocol fee receiver
+        if (totalProtocolFeeAmount != 0) {
+            payable(protocolFeeReceiver).sendValue(totalProtocolFeeAmount);
+        }
+
+        // Update toWithdrawAmount
+        toWithdrawAmount -= totalAmount;
+    }
+
+    /**
+     * @dev Redeem stCORE in storage-light mode.
+     * Only a hash chain over the records of the caller is stored, the record is emitted in {CommitRedeemRecord}
+     * and must be passed back to {withdrawCommitted()}.
+     */
+    function redeemCommitted(uint256 stCore) external afterSettled nonReentrant whenNotPaused {
+        address account = msg.sender;
+        (uint256 redeemAmount, uint256 protocolFee) = _burnSTCore(account, stCore);
+
+        RedeemRecord memory redeemRecord = RedeemRecord({
+            redeemTime: block.timestamp,
+            unlockTime: block.timestamp + DAY_INTERVAL * lockDay,
+            amount: redeemAmount,
+            stCore: stCore,
+            protocolFee: protocolFee
+        });
+        RedeemCommitment storage commitment = redeemCommitments[account];
+        bytes32 hash = keccak256(abi.encode(commitment.hash, redeemRecord));
+        commitment.hash = hash;
+        commitment.amount += redeemAmount.toUint128();
+        commitment.count += 1;
+
+        emit Redeem(account, stCore, redeemAmount, protocolFee);
+        emit CommitRedeemRecord(account, hash, redeemRecord);
+    }
+
+    /**
+     * @dev Withdraw CORE for the unlocked records made by {redeemCommitted()}.
+     * All outstanding records of the caller must be passed in redemption order, they are verified against the commitment.
+     * The commitment is rebuilt over the records which are still locked.
+     */
+    function withdrawCommitted(RedeemRecord[] calldata records) external afterSettled nonReentrant {
+        address account = msg.sender;
+        RedeemCommitment storage commitment = redeemCommitments[account];
+        if (commitment.count == 0) {
+            revert IEarnErrors.EarnEmptyRedeemRecord();
+        }
+
+        bytes32 hash;
+        bytes32 remainingHash;
+        uint256 accountAmount;
+        uint256 protocolFeeAmount;
+        uint256 unlockedCount;
+        for (uint256 i = 0; i < records.length; i++) {
+            RedeemRecord calldata record = records[i];
+            hash = keccak256(abi.encode(hash, record));
+            if (record.unlockTime < block.timestamp) {
                 accountAmount += record.amount;
                 protocolFeeAmount += record.protocolFee;
-                if (i != records.length) {
-                    records[i - 1] = records[records.length - 1];
-                }
-                records.pop();
+                unlockedCount++;
+            } else {
+                remainingHash = keccak256(abi.encode(remainingHash, record));
             }
         }
+        if (records.length != commitment.count || hash != commitment.hash) {
+            revert IEarnErrors.EarnRedeemCommitmentMismatch(account);
+        }
 
         // No eligible records found
         if (accountAmount == 0) {
             revert IEarnErrors.EarnRedeemRecordNotFound(account);
         }
 
-        // Amount of CORE to undelegate
-        uint256 totalAmount = accountAmount + protocolFeeAmount;
+        commitment.hash = remainingHash;
+        commitment.amount -= accountAmount.toUint128();
+        commitment.count -= unlockedCount.toUint128();
+
+        _payWithdrawal(account, accountAmount, protocolFeeAmount);
+    }
+
+    /**
+     * @dev Redeem stCORE through the protocol-wide withdrawal queue.
+     * Returns the id of the request, which can be claimed by {claimWithdrawal()} once finalized.
+     */
+    function requestWithdrawal(uint256 stCore) external afterSettled nonReentrant whenNotPaused returns (uint256 requestId) {
+        address account = msg.sender;
+        (uint256 redeemAmount, uint256 protocolFee) = _burnSTCore(account, stCore);
+        requestId = withdrawalQueue.push(account, block.timestamp + DAY_INTERVAL * lockDay, redeemAmount, protocolFee);
 
-        // Undelegate CORE from validators
-        _unDelegateWithStrategy(totalAmount);
+        emit RequestWithdrawal(account, requestId, stCore, redeemAmount, protocolFee);
+    }
 
-        // Transfer CORE to user
-        payable(account).sendValue(accountAmount);
+    /**
+     * @dev Finalize withdrawal requests unlocked so far, looking at no more than {maxRequests} requests.
+     * CORE of all the requests is made available together and protocol fees are paid in one transfer.
+     * Anyone can call this method.
+     */
+    function finalizeWithdrawals(uint256 maxRequests) external afterSettled nonReentrant {
+        uint256 fromId = withdrawalQueue.finalizedId;
+        uint256 toId = withdrawalQueue.lastUnlockedId(block.timestamp, maxRequests);
+        if (toId == fromId) {
+            revert IEarnErrors.EarnNoWithdrawalRequestToFinalize();
+        }
+
+        (uint256 amount, uint256 protocolFee) = withdrawalQueue.finalize(toId);
+        uint256 totalAmount = amount + protocolFee;
+        _prepareWithdrawal(totalAmount);
+        claimableAmount += amount;
 
         // Transfer CORE to porotocol fee receiver
-        if (protocolFeeAmount != 0) {
-            payable(protocolFeeReceiver).sendValue(protocolFeeAmount);
+        if (protocolFee != 0) {
+            payable(protocolFeeReceiver).sendValue(protocolFee);
         }
 
         // Update toWithdrawAmount
         toWithdrawAmount -= totalAmount;
 
-        emit Withdraw(account, accountAmount, protocolFeeAmount);
+        emit FinalizeWithdrawals(fromId + 1, toId, amount, protocolFee);
+    }
+
+    /**
+     * @dev Claim CORE of a finalized withdrawal request made by the caller.
+     */
+    function claimWithdrawal(uint256 requestId) external nonReentrant {
+        address account = msg.sender;
+        if (requestId > withdrawalQueue.finalizedId) {
+            revert IEarnErrors.EarnWithdrawalRequestNotFinalized(requestId);
+        }
+        WithdrawalRequest storage request = withdrawalQueue.requests[requestId];
+        if (request.account != account) {
+            revert IEarnErrors.EarnWithdrawalRequestNotOwned(account, requestId);
+        }
+
+        // The running totals are kept for the following requests
+        request.account = address(0);
+        uint256 amount = withdrawalQueue.amountOf(requestId);
+        claimableAmount -= amount;
+
+        // Transfer CORE to user
+        payable(account).sendValue(amount);
+
+        emit ClaimWithdrawal(account, requestId, amount);
     }
 
     /// --- OPERATOR INTERACTIONS --- ///
@@ -332,64 +669,53 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
      * The parameter type is set to address[] instead of address for forward compatibilities.
      */
     function afterTurnRound(address[] memory newElectedValidators) external onlyOperator {
-        // Claim rewards
-        for (uint i = validatorDelegateMap.size(); i != 0; i--) {
-            address key = validatorDelegateMap.getKeyAtIndex(i - 1);
+        // Drop the progress of {afterTurnRoundPaged()} if any
+        settleCursor = 0;
 
-            // Claim reward from validator
-            _claim(key);
-
-            // Check validator status
-            if (!_isActive(key)) {
-                // Undelegate from inactive validator
-                _unDelegate(key, 0);
-            }
-        }
+        uint256 currentRound = _currentRound();
+        _settleValidators(0, validatorDelegateMap.size(), 0);
+        _finishTurnRound(newElectedValidators, currentRound);
+    }
 
-        // Delegate all claimed rewards + undelegate amounts from inactive validators 
-        //  to a random chosen validator
-        // If all validators staked by Earn in last round become inactive
-        //  choose the first validator in the passed in array
-        uint256 validatorSize = validatorDelegateMap.size();
-        if (validatorSize == 0) {
-            if (newElectedValidators.length > 0 && ICandidateHub(CANDIDATE_HUB).canDelegate(newElectedValidators[0])) {
-                uint256 delegateAmount = address(this).balance;
-                if (delegateAmount >= pledgeAgentLimit) {
-                    _delegate(newElectedValidators[0], delegateAmount);
-                }
-            } else {
-                // should not happen
-                revert IEarnErrors.EarnValidatorsAllOffline();
-            }        
-        } else {
-            uint256 delegateAmount = address(this).balance;
-            if (delegateAmount >= pledgeAgentLimit) {
-                uint256 randomIndex = _randomIndex(validatorSize);
-                address randomKey = validatorDelegateMap.getKeyAtIndex(randomIndex);
-                _delegate(randomKey, delegateAmount);
-            }
+    /**
+     * @dev Same as {afterTurnRound()} but processes at most {pageSize} validators in each call.
+     * Validators of the page are checked one by one until the remaining gas runs low,
+     * at least one validator is processed in each call, then rewards of the checked validators are claimed in one call.
+     * Validators are processed from the end of {validatorDelegateMap} and the progress is kept in {settleCursor}.
+     * The round is settled, and the exchange rate is updated, when the last page is processed.
+     * Returns true if the round is settled.
+     */
+    function afterTurnRoundPaged(address[] memory newElectedValidators, uint256 pageSize) external onlyOperator returns (bool) {
+        if (pageSize == 0) {
+            revert IEarnErrors.EarnPageSizeMustGreaterThanZero();
         }
 
         uint256 currentRound = _currentRound();
+        uint256 cursor = settleCursor;
+        if (settlingRound != currentRound || cursor == 0) {
+            // Start settling the round from the end of the map
+            settlingRound = currentRound.toUint32();
+            cursor = validatorDelegateMap.size();
+        }
 
-        // Update exchange rate
-        uint256 totalSupply = IERC20(STCORE).totalSupply();
-        if (totalSupply > 0) {
-            uint256 _capital = 0;
-            for (uint256 i = 0; i < validatorDelegateMap.size(); i++) {
-                address key = validatorDelegateMap.getKeyAtIndex(i);
-                _capital += validatorDelegateMap.get(key);
-            }
-            if (_capital > toWithdrawAmount) {
-                uint256 rate = (_capital - toWithdrawAmount) * RATE_BASE / totalSupply;
-                exchangeRates.push(rate);
-                
-                emit CalculateExchangeRate(currentRound, rate);
-            }
+        uint256 from = cursor > pageSize ? cursor - pageSize : 0;
+        uint256 settled = _settleValidators(from, cursor, SETTLE_GAS_RESERVE);
+        settleCursor = settled.toUint32();
+        if (settled != 0) {
+            return false;
         }
 
-        // Update round tag
-        roundTag = currentRound;
+        _finishTurnRound(newElectedValidators, currentRound);
+        return true;
+    }
+
+    /**
+     * @dev Delegates CORE buffered by mint to the validators chosen by users.
+     * Buffered CORE is also delegated in {afterTurnRound()}, this method allows
+     * the operator to do it earlier in a round.
+     */
+    function flushPendingDelegations() external afterSettled onlyOperator {
+        _flushPendingDelegations();
     }
 
     /**
@@ -397,253 +723,958 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
      * The Earn contract rebalances staking on top/bottom validators in this method.
      */
     function reBalance() external afterSettled onlyOperator{
-        if (validatorDelegateMap.size() <= 1) {
-            revert IEarnErrors.EarnEmptyValidator();
-        }
+        _reBalance();
+    }
 
-        // Use the first validator as a benchmark
-        address key = validatorDelegateMap.getKeyAtIndex(0);
-        uint256 initDelegateAmount = validatorDelegateMap.get(key);
+    /**
+     * @dev Same as {reBalance()} but keeps transferring stakes from the top validator
+     * to the bottom one in a single transaction.
+     * Stops when the max/min difference falls below {balanceThreshold}, the next transfer
+     * amount is invalid, {maxTransfers} transfers are made or the remaining gas runs low.
+     * The first transfer reverts under the same conditions as {reBalance()}.
+     */
+    function batchReBalance(uint256 maxTransfers) external afterSettled onlyOperator{
+        _reBalance();
+
+        uint256 transfers = 1;
+        while (transfers < maxTransfers && gasleft() >= REBALANCE_GAS_RESERVE) {
+            address maxValidator = validatorDelegateMap.getMaxKey();
+            uint256 max = validatorDelegateMap.get(maxValidator);
+            address minValidator = validatorDelegateMap.getMinKey();
+            uint256 min = validatorDelegateMap.get(minValidator);
+
+            if (max == min || max - min < balanceThreshold) {
+                break;
+            }
 
-        // Find max and min delegate amounts in all validators
-        uint256 max = initDelegateAmount;
-        address maxValidator = key;
-        uint256 min = initDelegateAmount;
-        address minValidator = key;
-        for (uint256 i = 1; i < validatorDelegateMap.size(); i++) {
-            key = validatorDelegateMap.getKeyAtIndex(i);
-            uint256 delegateAmount = validatorDelegateMap.get(key);
-            if (delegateAmount > max) {
-                max = delegateAmount;
-                maxValidator = key;
-            } else if (delegateAmount < min) {
-                min = delegateAmount;
-                minValidator = key;
+            uint256 transferAmount = (max - min) / 2;
+            if (!_isValidReBalanceTransfer(max, transferAmount)) {
+                break;
             }
+
+            _transfer(maxValidator, minValidator, transferAmount);
+            emit ReBalance(maxValidator, minValidator, transferAmount);
+            transfers++;
         }
+    }
 
-        if (minValidator == maxValidator) {
-            revert IEarnErrors.EarnReBalanceNoNeed(maxValidator, minValidator);
+    /**
+     * @dev This method is introduce to take necessary actions to improve earning.
+     * e.g. to transfer stakes from a jailed validator to another before turn round.
+     * e.g. to transfer stakes from a low APR validator to a high APR validator.
+     */
+    function manualReBalance(address _from, address _to, uint256 _transferAmount) external afterSettled onlyOperator canDelegate(_to){
+        if (validatorDelegateMap.size() == 0) {
+            revert IEarnErrors.EarnEmptyValidator();
         }
 
-        if (max - min < balanceThreshold) {
-            revert IEarnErrors.EarnReBalanceAmountDifferenceLessThanThreshold(maxValidator, minValidator, max, min, balanceThreshold);
+        uint256 fromValidatorAmount = validatorDelegateMap.get(_from);
+
+        if (fromValidatorAmount < _transferAmount) {
+            revert IEarnErrors.EarnReBalanceInsufficientAmount(_from, fromValidatorAmount, _transferAmount);
         }
+        
+        _reBalanceTransfer(_from, _to, fromValidatorAmount, _transferAmount);
+    }
 
-        // Transfer CORE to rebalance
-        uint256 transferAmount = (max - min) / 2;
+    /// --- VIEW METHODS ---///
+
+    /**
+     * @dev Returns redemption records based on the given address.
+     */
+    function getRedeemRecords(address _account) external view returns (RedeemRecord[] memory) {
+        return _getRedeemRecords(_account);
+    }
+
+    /**
+     * @dev Returns the redemption record of the given address at position {index}.
+     * Kept for compatibility with the getter of the redeem records before {redeemQueues} was introduced.
+     */
+    function redeemRecords(address _account, uint256 index) external view returns (uint256 redeemTime, uint256 unlockTime, uint256 amount, uint256 stCore, uint256 protocolFee) {
+        RedeemRecord memory record;
+        RedeemRecord[] storage legacyRecords = legacyRedeemRecords[_account];
+        if (legacyRecords.length != 0) {
+            record = legacyRecords[index];
+        } else {
+            RedeemRecordQueue.Queue storage queue = redeemQueues[_account];
+            if (index >= queue.length()) {
+                revert IEarnErrors.EarnRedeemRecordNotFound(_account);
+            }
+            record = queue.at(index);
+        }
+        return (record.redeemTime, record.unlockTime, record.amount, record.stCore, record.protocolFee);
+    }
+
+    /**
+     * @dev Returns at most {limit} redemption records of the given address starting from position {offset}.
+     */
+    function getRedeemRecords(address _account, uint256 offset, uint256 limit) external view returns (RedeemRecord[] memory) {
+        return _getRedeemRecordsPage(_account, false, false, offset, limit);
+    }
+
+    /**
+     * @dev Returns at most {limit} unlocked or locked redemption records of the given address
+     * starting from position {offset} among the selected records.
+     */
+    function getRedeemRecordsByLockStatus(address _account, bool unlocked, uint256 offset, uint256 limit) external view returns (RedeemRecord[] memory) {
+        return _getRedeemRecordsPage(_account, true, unlocked, offset, limit);
+    }
+
+    /**
+     * @dev Returns the lock and unlock amount based on the given address.
+     * Amounts are read from the running totals of the redeem queue,
+     * records not yet moved from {legacyRedeemRecords} are iterated.
+     */
+    function getRedeemAmount(address _account) external view returns (uint256 unlockedAmount, uint256 lockedAmount) {
+        RedeemRecordQueue.Queue storage queue = redeemQueues[_account];
+        if (legacyRedeemRecords[_account].length == 0) {
+            unlockedAmount = queue.unlockedAmount(block.timestamp);
+            lockedAmount = queue.totalAmount() - unlockedAmount;
+            return (unlockedAmount, lockedAmount);
+        }
+
+        RedeemRecord[] memory records = legacyRedeemRecords[_account];
+        for (uint256 i = 0; i < records.length; i++) {
+            RedeemRecord memory record = records[i];
+             if (record.unlockTime < block.timestamp) {
+                unlockedAmount += record.amount;
+            } else {
+                lockedAmount += record.amount;
+            }
+        }
+    }
+
+    /**
+     * @dev Returns the exchange rate of the last {target} days.
+     */
+    function getExchangeRates(uint256 target) external view returns(uint256[] memory _exchangeRates) {
+        if (target > exchangeRateQueryLimit) {
+            return _exchangeRates;
+        }
+
+        if (target < 1) {
+            return _exchangeRates;
+        }
+
+        uint256 size = exchangeRateHistory.length();
+        uint256 from = 0;
+        uint256 count;
+        if (target >= size) {
+            count = size;
+        } else {
+            from = size - target;
+            count = target;
+        }
+
+        _exchangeRates = new uint256[](count);
+        for (uint256 i = from; i < size; i++) {
+            (, uint256 rate) = exchangeRateHistory.at(i);
+            _exchangeRates[i-from] = rate;
+        }
+    }
+
+    /**
+     * @dev Returns the exchange rate at position {index} of the exchange rate history, counted from the first rate recorded.
+     * Kept for compatibility with the getter of the exchange rates before {exchangeRateHistory} was introduced,
+     * only the latest {ExchangeRateRingBuffer.CAPACITY} rates can be read.
+     */
+    function exchangeRates(uint256 index) external view returns (uint256) {
+        (bool found, , uint256 rate) = exchangeRateHistory.atPosition(index);
+        if (!found) {
+            revert IEarnErrors.EarnExchangeRateIndexNotFound(index);
+        }
+        return rate;
+    }
+
+    /**
+     * @dev Returns the exchange rate in effect at the given round,
+     * which is the latest rate calculated at or before the round.
+     */
+    function getExchangeRateAt(uint256 round) external view returns (uint256) {
+        return _exchangeRateAt(round);
+    }
+
+    /**
+     * @dev Returns the compounded growth of the exchange rate from {fromRound} to {toRound} in {RATE_BASE},
+     * together with the number of rounds in between.
+     * The exchange rate already compounds rewards, so the growth is the ratio of the rates in effect at the two rounds
+     * and is found with two lookups into {exchangeRateHistory} whatever the window is.
+     */
+    function getExchangeRateGrowth(uint256 fromRound, uint256 toRound) external view returns (uint256 growth, uint256 rounds) {
+        if (fromRound > toRound) {
+            revert IEarnErrors.EarnInvalidRoundRange(fromRound, toRound);
+        }
+        uint256 fromRate = _exchangeRateAt(fromRound);
+        uint256 toRate = _exchangeRateAt(toRound);
+        return (toRate * RATE_BASE / fromRate, toRound - fromRound);
+    }
+
+    /**
+     * @dev Returns the exchange rates calculated in rounds between {fromRound} and {toRound}, both inclusive.
+     * At most {exchangeRateQueryLimit} rates are returned starting from {fromRound}.
+     */
+    function getExchangeRatesByRound(uint256 fromRound, uint256 toRound) external view returns (uint256[] memory rounds, uint256[] memory rates) {
+        if (fromRound > toRound || fromRound == 0) {
+            return (rounds, rates);
+        }
+
+        (bool found, uint256 to) = exchangeRateHistory.findIndex(toRound);
+        if (!found) {
+            return (rounds, rates);
+        }
+
+        // First entry of the range is the one after the latest entry recorded before {fromRound}
+        (bool hasPrevious, uint256 from) = exchangeRateHistory.findIndex(fromRound - 1);
+        if (hasPrevious) {
+            from++;
+        }
+        if (from > to) {
+            return (rounds, rates);
+        }
+
+        uint256 count = to - from + 1;
+        if (count > exchangeRateQueryLimit) {
+            count = exchangeRateQueryLimit;
+        }
+
+        rounds = new uint256[](count);
+        rates = new uint256[](count);
+        for (uint256 i = 0; i < count; i++) {
+            (rounds[i], rates[i]) = exchangeRateHistory.at(from + i);
+        }
+    }
+
+    /**
+     * @dev Returns current latest exchange rate.
+     */
+    function getCurrentExchangeRate() external view  returns (uint256) {
+        return currentExchangeRate;
+    } 
+
+    /**
+     * @dev Returns the total amount delegated in {PLEDGE_AGENT} for this contract.
+     */
+    function getTotalDelegateAmount() external view returns (uint256) {
+        return validatorDelegateMap.getTotal();
+    }
+
+    /**
+     * @dev Returns the validators delegated by this contract and the amount on each of them.
+     * Items are returned from position {offset} of {validatorDelegateMap}, at most {limit} items are returned.
+     */
+    function getValidatorDelegations(uint256 offset, uint256 limit) external view returns (address[] memory validators, uint256[] memory amounts) {
+        uint256 size = validatorDelegateMap.size();
+        if (offset >= size) {
+            return (validators, amounts);
+        }
+
+        uint256 count = size - offset;
+        if (count > limit) {
+            count = limit;
+        }
+
+        validators = new address[](count);
+        amounts = new uint256[](count);
+        for (uint256 i = 0; i < count; i++) {
+            validators[i] = validatorDelegateMap.getKeyAtIndex(offset + i);
+            amounts[i] = validatorDelegateMap.get(validators[i]);
+        }
+    }
+
+    /**
+     * @dev Returns the hint to pass to {mintWithHint()} for delegating {amount} to the validator.
+     * The sorted list is walked from the start, so this method is meant to be called off-chain.
+     */
+    function getDelegateHint(address validator, uint256 amount) external view returns (address) {
+        return validatorDelegateMap.findHint(validator, validatorDelegateMap.get(validator) + amount);
+    }
+
+    /**
+     * @dev Returns the amount buffered by mint to be delegated to the validator.
+     */
+    function getPendingDelegation(address validator) external view returns (uint256) {
+        return pendingDelegations[validator];
+    }
+
+    /**
+     * @dev Returns the commitment to the redeem records made by {redeemCommitted()},
+     * the sum of amounts and the number of the outstanding records.
+     */
+    function getRedeemCommitment(address _account) external view returns (bytes32 commitment, uint256 amount, uint256 count) {
+        RedeemCommitment storage redeemCommitment = redeemCommitments[_account];
+        return (redeemCommitment.hash, redeemCommitment.amount, redeemCommitment.count);
+    }
+
+    /**
+     * @dev Returns the request in the protocol-wide withdrawal queue.
+     * The account is cleared once the request is claimed.
+     */
+    function getWithdrawalRequest(uint256 requestId) external view returns (address account, uint256 unlockTime, uint256 amount, bool finalized) {
+        if (requestId == 0 || requestId > withdrawalQueue.lastId) {
+            return (address(0), 0, 0, false);
+        }
+        WithdrawalRequest storage request = withdrawalQueue.requests[requestId];
+        return (request.account, request.unlockTime, withdrawalQueue.amountOf(requestId), requestId <= withdrawalQueue.finalizedId);
+    }
+
+    /**
+     * @dev Returns the id of the latest request and the id of the latest finalized request in the withdrawal queue.
+     */
+    function getWithdrawalRequestIds() external view returns (uint256 lastRequestId, uint256 finalizedRequestId) {
+        return (withdrawalQueue.lastId, withdrawalQueue.finalizedId);
+    }
+
+    /// --- INTERNAL METHODS --- ///
+
+    /**
+     * @dev Returns the current round.
+     * Calls {CANDIDATE_HUB.getRoundTag()}.
+     */
+    function _currentRound() private view returns (uint256) {
+        return ICandidateHub(CANDIDATE_HUB).getRoundTag();
+    }
+
+    /**
+     * @dev Returns the latest exchange rate calculated at or before the round.
+     */
+    function _exchangeRateAt(uint256 round) private view returns (uint256) {
+        (bool found, uint256 index) = exchangeRateHistory.findIndex(round);
+        if (!found) {
+            revert IEarnErrors.EarnExchangeRateNotFound(round);
+        }
+        (uint256 rateRound, uint256 rate) = exchangeRateHistory.at(index);
+        // Legacy rates are recorded with round 0 and can not be located by round
+        if (rateRound == 0) {
+            revert IEarnErrors.EarnExchangeRateNotFound(round);
+        }
+        return rate;
+    }
+
+    /**
+     * @dev Exchanges core to stCore.
+     */
+    function _exchangeSTCore(uint256 core) private view returns (uint256) {
+        return core * RATE_BASE / currentExchangeRate;
+    }
+
+    /**
+     * @dev Exchanges stCore to core.
+     */
+    function _exchangeCore(uint256 stCore) private view returns(uint256) {
+        return stCore * currentExchangeRate / RATE_BASE;
+    }
+
+    /**
+     * @dev Exchanges core to stCore.
+     * Undelegate CORE from validators with strategy.
+     * There is dues protection in PledageAgent, which are
+     *   1. Can only delegate 1+ CORE
+     *   2. Can only undelegate 1+ CORE AND can only leave 1+ CORE on validator after undelegate
+     * Internally, Earn delegates/undelegates on validators for each mint/redeem action.
+     * As a result, to make the system solid. Any undelegate action on a validator from Earn must result in
+     *   1. The validator must be cleared or have 1+ CORE remaining after undelegate.
+     *     AND
+     *   2. Earn contract must have 0 or 1+ CORE left to further undelegate.
+     * Otherwise, Earn might fail to undelegate further because of the dues protection from PledgeAgent.
+     */
+    function _unDelegateWithStrategy(uint256 amount) private {
+        if (validatorDelegateMap.size() == 0) {
+            revert IEarnErrors.EarnEmptyValidator();
+        }
+        if (amount == 0) {
+            return;
+        }
+
+        // Prefer a single validator which covers the whole amount so that only one undelegate call is made to PledgeAgent
+        // Validators are visited from the top of the list down to the first one holding less than the amount
+        address key = validatorDelegateMap.getMaxKey();
+        while (key != address(0)) {
+            uint256 validatorAmount = validatorDelegateMap.get(key);
+            if (validatorAmount < amount) {
+                break;
+            }
+            if (validatorAmount == amount || validatorAmount >= amount + pledgeAgentLimit) {
+                _unDelegate(key, amount);
+                return;
+            }
+            key = validatorDelegateMap.getPrevKey(key);
+        }
+
+        // Walk down from the validator with the most CORE delegated
+        key = validatorDelegateMap.getMaxKey();
+        bool reachedEnd = false;
+        while(key != address(0) && amount > 0) {
+            // Read before undelegate, which moves the key towards the head
+            address prevKey = validatorDelegateMap.getPrevKey(key);
+            uint256 validatorAmount = validatorDelegateMap.get(key);
+
+            if (validatorAmount > 0) {
+                if (validatorAmount == amount) {
+                    // Case 1: the amount available on the validator == the amount needs to be undelegated
+                    // Undelegate all the tokens from the validator
+                    _unDelegate(key, amount);
+                    amount = 0;
+                    break;
+                } else if (validatorAmount > amount) {
+                    if (validatorAmount >= amount + pledgeAgentLimit) {
+                    // Case 2: the amount available on the validator >= the amount needs to be undelegated + 1
+                    // Undelegate all the tokens from the validator
+                        _unDelegate(key, amount);
+                        amount = 0;
+                        break;
+                    } else {
+                        // Case 3: the amount available on the validator >= the amount needs to be undelegated AND
+                        //          the amount available on the validator <= the amount needs to be undelegated + 1
+                        // In this case we need to make sure there are 1 CORE token left to further undelegate 
+                        uint256 undelegateAmount = amount - pledgeAgentLimit;
+                        if (undelegateAmount > pledgeAgentLimit) {
+                            _unDelegate(key, undelegateAmount);
+                            amount -= undelegateAmount;
+                        }
+                    }
+                } else {
+                    if (amount >= validatorAmount + pledgeAgentLimit) {
+                        // Case 4: the amount available on the validator <= the amount needs to be undelegated - 1
+                        // Clear the validator and move to the next one
+                        _unDelegate(key, validatorAmount);
+                        amount -= validatorAmount;
+                    } else {
+                        // Case 5: the amount available on the validator >= the amount needs to be undelegated - 1 AND
+                        //          the amount available on the validator <= the amount needs to be undelegated
+                        // In this case we need to make sure there are 1 CORE token left on validator 
+                        uint256 undelegateAmount = validatorAmount - pledgeAgentLimit;
+                        if (undelegateAmount > pledgeAgentLimit) {
+                            _unDelegate(key, undelegateAmount);
+                            amount -= undelegateAmount;
+                        }
+                    }
+                }
+            }
+
+            key = prevKey;
+            if (key == address(0) && !reachedEnd) {
+                // Walk once more since the amount left might fit validators passed before
+                key = validatorDelegateMap.getMaxKey();
+                reachedEnd = true;
+            }
+        }
+
+        // Earn protocol is insolvency
+        // In theory this could not happen if Earn is funded before open to public
+        if (amount > 0) {
+             revert IEarnErrors.EarnUnDelegateFailedFinally(msg.sender, amount);
+        }
+    }
+
+    /**
+     * @dev Moves the redeem records of the account from {legacyRedeemRecords} to {redeemQueues}.
+     * Legacy records are reordered by swap-and-pop on withdraw, so they are sorted by unlock time before queued.
+     */
+    function _migrateRedeemRecords(address account) private {
+        RedeemRecord[] storage legacyRecords = legacyRedeemRecords[account];
+        if (legacyRecords.length == 0) {
+            return;
+        }
+
+        RedeemRecord[] memory records = legacyRecords;
+        for (uint256 i = 1; i < records.length; i++) {
+            RedeemRecord memory record = records[i];
+            uint256 j = i;
+            while (j != 0 && records[j - 1].unlockTime > record.unlockTime) {
+                records[j] = records[j - 1];
+                j--;
+            }
+            records[j] = record;
+        }
+
+        RedeemRecordQueue.Queue storage queue = redeemQueues[account];
+        for (uint256 i = 0; i < records.length; i++) {
+            queue.push(records[i]);
+        }
+        delete legacyRedeemRecords[account];
+    }
+
+    /**
+     * @dev Returns redemption records of the account in order of unlock time.
+     * Records not yet moved from {legacyRedeemRecords} are returned as they are stored.
+     */
+    function _getRedeemRecords(address account) private view returns (RedeemRecord[] memory records) {
+        RedeemRecord[] storage legacyRecords = legacyRedeemRecords[account];
+        if (legacyRecords.length != 0) {
+            return legacyRecords;
+        }
+
+        RedeemRecordQueue.Queue storage queue = redeemQueues[account];
+        records = new RedeemRecord[](queue.length());
+        for (uint256 i = 0; i < records.length; i++) {
+            records[i] = queue.at(i);
+        }
+    }
+
+    /**
+     * @dev Calls {PLEDGE_AGENT} to perform {delegateCoin()} operation.
+     */
+    function _delegate(address validator, uint256 amount) private {
+        _delegate(validator, amount, address(0));
+    }
+
+    /**
+     * @dev Calls {PLEDGE_AGENT} to perform {delegateCoin()} operation,
+     * {hint} is passed to {validatorDelegateMap} to position the validator.
+     */
+    function _delegate(address validator, uint256 amount, address hint) private {
+        IPledgeAgent(PLEDGE_AGENT).delegateCoin{value: amount}(validator);
+        // Update delegate record
+        validatorDelegateMap.add(validator, amount, hint);
+        emit Delegate(validator, amount);
+    }
+
+    /**
+     * @dev Returns a page of redemption records of the account.
+     * If {byLockStatus} is set, only unlocked or locked records are selected according to {unlocked}.
+     * Unlocked records are at the front of the redeem queue, so the page is read directly from the queue.
+     */
+    function _getRedeemRecordsPage(address account, bool byLockStatus, bool unlocked, uint256 offset, uint256 limit) private view returns (RedeemRecord[] memory records) {
+        RedeemRecord[] storage legacyRecords = legacyRedeemRecords[account];
+        if (legacyRecords.length != 0) {
+            RedeemRecord[] memory selected = new RedeemRecord[](legacyRecords.length);
+            uint256 selectedCount = 0;
+            for (uint256 i = 0; i < legacyRecords.length; i++) {
+                RedeemRecord memory record = legacyRecords[i];
+                if (!byLockStatus || (record.unlockTime < block.timestamp) == unlocked) {
+                    selected[selectedCount++] = record;
+                }
+            }
+            if (offset >= selectedCount) {
+                return records;
+            }
+            uint256 legacyCount = selectedCount - offset;
+            if (legacyCount > limit) {
+                legacyCount = limit;
+            }
+            records = new RedeemRecord[](legacyCount);
+            for (uint256 i = 0; i < legacyCount; i++) {
+                records[i] = selected[offset + i];
+            }
+            return records;
+        }
+
+        RedeemRecordQueue.Queue storage queue = redeemQueues[account];
+        uint256 from = 0;
+        uint256 to = queue.length();
+        if (byLockStatus) {
+            uint256 unlockedLength = queue.unlockedLength(block.timestamp);
+            if (unlocked) {
+                to = unlockedLength;
+            } else {
+                from = unlockedLength;
+            }
+        }
+        if (offset >= to - from) {
+            return records;
+        }
+
+        uint256 count = to - from - offset;
+        if (count > limit) {
+            count = limit;
+        }
+        records = new RedeemRecord[](count);
+        for (uint256 i = 0; i < count; i++) {
+            records[i] = queue.at(from + offset + i);
+        }
+    }
+
+    /**
+     * @dev Settles the validators at positions [from, to) of {validatorDelegateMap}:
+     * claims their rewards and undelegates from the inactive ones.
+     * Validators are checked from the end until the remaining gas falls below {gasReserve},
+     * the first one is always checked. Rewards are then claimed in a single call for the checked validators only,
+     * and the inactive ones are undelegated from the end, so that removing a validator
+     * only moves an already settled one into its position.
+     * Returns the position up to which validators are not settled yet.
+     * Returns {to} if rewards are left to claim when the remaining gas falls below {gasReserve},
+     * the claim is continued in the next call.
+     */
+    function _settleValidators(uint256 from, uint256 to, uint256 gasReserve) private returns (uint256) {
+        address[] memory keys = new address[](to - from);
+        bool[] memory inactive = new bool[](to - from);
+        uint256 settled = to;
+        while (settled != from && (settled == to || gasleft() >= gasReserve)) {
+            settled--;
+            address key = validatorDelegateMap.getKeyAtIndex(settled);
+            keys[settled - from] = key;
+
+            // Check validator status
+            inactive[settled - from] = !_isActive(key);
+        }
+
+        address[] memory validators = new address[](to - settled);
+        for (uint256 i = 0; i < validators.length; i++) {
+            validators[i] = keys[settled - from + i];
+        }
+
+        // Claim rewards from the checked validators in a single call
+        if (!_claim(validators, gasReserve)) {
+            return to;
+        }
+
+        for (uint256 i = validators.length; i != 0; i--) {
+            if (inactive[settled - from + i - 1]) {
+                // Undelegate from inactive validator
+                _unDelegate(validators[i - 1], 0);
+            }
+        }
+        return settled;
+    }
+
+    /**
+     * @dev Delegates CORE kept in the contract and updates the exchange rate of the round.
+     * Called once all delegated validators are processed by {_settleValidators()}.
+     */
+    function _finishTurnRound(address[] memory newElectedValidators, uint256 currentRound) private {
+        // Delegate CORE buffered by mint during last round
+        _flushPendingDelegations();
+
+        // CORE kept for withdrawals and set aside for finalized withdrawal requests is not delegated
+        // In buffer mode claimed rewards are kept to serve withdrawals instead of being delegated,
+        //  up to {withdrawReserveLimit} so that rewards are not held for redemptions still locked
+        uint256 delegateAmount = address(this).balance - withdrawReserve - claimableAmount;
+        uint256 reserveLimit = toWithdrawAmount < withdrawReserveLimit ? toWithdrawAmount : withdrawReserveLimit;
+        if (mintBufferEnabled && reserveLimit > withdrawReserve) {
+            uint256 reserveAmount = reserveLimit - withdrawReserve;
+            if (reserveAmount > delegateAmount) {
+                reserveAmount = delegateAmount;
+            }
+            withdrawReserve += reserveAmount.toUint120();
+            delegateAmount -= reserveAmount;
+        }
+
+        // Delegate all claimed rewards + undelegate amounts from inactive validators 
+        //  to a random chosen validator
+        // If all validators staked by Earn in last round become inactive
+        //  choose the first validator in the passed in array
+        uint256 validatorSize = validatorDelegateMap.size();
+        if (validatorSize == 0) {
+            if (newElectedValidators.length > 0 && _canDelegate(newElectedValidators[0])) {
+                if (delegateAmount >= pledgeAgentLimit) {
+                    _delegate(newElectedValidators[0], delegateAmount);
+                }
+            } else {
+                // should not happen
+                revert IEarnErrors.EarnValidatorsAllOffline();
+            }        
+        } else {
+            if (delegateAmount >= pledgeAgentLimit) {
+                if (reinvestValidatorCount == 0) {
+                    uint256 randomIndex = _randomIndex(validatorSize);
+                    address randomKey = validatorDelegateMap.getKeyAtIndex(randomIndex);
+                    _delegate(randomKey, delegateAmount);
+                } else {
+                    _reinvestToLeastDelegated(delegateAmount);
+                }
+            }
+        }
+
+        // Update exchange rate
+        uint256 totalSupply = IERC20(STCORE).totalSupply();
+        if (totalSupply > 0) {
+            uint256 _capital = validatorDelegateMap.getTotal() + pendingDelegateAmount + withdrawReserve;
+            if (_capital > toWithdrawAmount) {
+                uint256 rate = (_capital - toWithdrawAmount) * RATE_BASE / totalSupply;
+                // A rate too large to be recorded is skipped like a round without supply, the latest rate is kept
+                if (rate <= type(uint96).max) {
+                    exchangeRateHistory.push(currentRound, rate);
+                    currentExchangeRate = uint96(rate);
+
+                    emit CalculateExchangeRate(currentRound, rate);
+                }
+            }
+        }
+
+        _recordNewValidators(newElectedValidators);
 
-        _reBalanceTransfer(maxValidator, minValidator, max, transferAmount);
+        // Update round tag
+        roundTag = currentRound.toUint32();
     }
 
     /**
-     * @dev This method is introduce to take necessary actions to improve earning.
-     * e.g. to transfer stakes from a jailed validator to another before turn round.
-     * e.g. to transfer stakes from a low APR validator to a high APR validator.
+     * @dev Replaces {newValidators} with the new elected validators which are not delegated by Earn
+     * and can be delegated to.
      */
-    function manualReBalance(address _from, address _to, uint256 _transferAmount) external afterSettled onlyOperator canDelegate(_to){
-        if (validatorDelegateMap.size() == 0) {
-            revert IEarnErrors.EarnEmptyValidator();
+    function _recordNewValidators(address[] memory newElectedValidators) private {
+        delete newValidators;
+        for (uint256 i = 0; i < newElectedValidators.length; i++) {
+            address validator = newElectedValidators[i];
+            if (!validatorDelegateMap.exist(validator) && _canDelegate(validator)) {
+                newValidators.push(validator);
+            }
         }
+    }
 
-        uint256 fromValidatorAmount = validatorDelegateMap.get(_from);
+    /**
+     * @dev Splits the amount evenly across the {reinvestValidatorCount} active validators
+     * with the least delegate amounts, so reinvesting rewards also balances stakes.
+     * Fewer validators are used if a share would fall below {pledgeAgentLimit}.
+     */
+    function _reinvestToLeastDelegated(uint256 amount) private {
+        uint256 count = reinvestValidatorCount;
+        if (count > amount / pledgeAgentLimit) {
+            count = amount / pledgeAgentLimit;
+        }
 
-        if (fromValidatorAmount < _transferAmount) {
-            revert IEarnErrors.EarnReBalanceInsufficientAmount(_from, fromValidatorAmount, _transferAmount);
+        // Targets are collected first since delegating reorders {validatorDelegateMap}
+        address[] memory validators = new address[](count);
+        uint256 found = 0;
+        address validator = validatorDelegateMap.getMinKey();
+        while (validator != address(0) && found < count) {
+            if (_canDelegate(validator)) {
+                validators[found++] = validator;
+            }
+            validator = validatorDelegateMap.getNextKey(validator);
+        }
+        if (found == 0) {
+            // should not happen
+            revert IEarnErrors.EarnValidatorsAllOffline();
         }
-        
-        _reBalanceTransfer(_from, _to, fromValidatorAmount, _transferAmount);
-    }
 
-    /// --- VIEW METHODS ---///
+        // The remainder goes to the validator with the least delegate amount
+        uint256 share = amount / found;
+        _delegate(validators[0], amount - share * (found - 1));
+        for (uint256 i = 1; i < found; i++) {
+            _delegate(validators[i], share);
+        }
+    }
 
     /**
-     * @dev Returns redemption records based on the given address.
+     * @dev Records minted CORE to be delegated to the validator in the next flush.
      */
-    function getRedeemRecords(address _account) external view returns (RedeemRecord[] memory) {
-        return redeemRecords[_account];
+    function _bufferDelegate(address validator, uint256 amount) private {
+        if (pendingDelegations[validator] == 0) {
+            pendingValidators.push(validator);
+        }
+        pendingDelegations[validator] += amount;
+        pendingDelegateAmount += amount.toUint128();
     }
 
     /**
-     * @dev Returns the lock and unlock amount based on the given address.
+     * @dev Delegates buffered CORE with one {delegateCoin()} call per validator.
+     * CORE recorded for validators which can not be delegated to any more is left in the contract
+     * and delegated together with claimed rewards in {afterTurnRound()}.
+     * Validators are checked by {_canDelegate()} since one may be jailed after it was found active in the round.
      */
-    function getRedeemAmount(address _account) external view returns (uint256 unlockedAmount, uint256 lockedAmount) {
-        RedeemRecord[] storage records = redeemRecords[_account];
-        for (uint256 i = 0; i < records.length; i++) {
-            RedeemRecord memory record = records[i];
-             if (record.unlockTime < block.timestamp) {
-                unlockedAmount += record.amount;
-            } else {
-                lockedAmount += record.amount;
+    function _flushPendingDelegations() private {
+        uint256 length = pendingValidators.length;
+        if (length == 0) {
+            return;
+        }
+
+        uint256 flushAmount = pendingDelegateAmount;
+        for (uint256 i = 0; i < length; i++) {
+            address validator = pendingValidators[i];
+            uint256 amount = pendingDelegations[validator];
+            delete pendingDelegations[validator];
+            if (amount >= pledgeAgentLimit && _canDelegate(validator)) {
+                _delegate(validator, amount);
             }
         }
+        delete pendingValidators;
+        pendingDelegateAmount = 0;
+
+        emit FlushPendingDelegations(flushAmount);
     }
 
     /**
-     * @dev Returns the exchange rate of the last {target} days.
+     * @dev Delegates the minted CORE to the validator and sends stCORE to the account.
      */
-    function getExchangeRates(uint256 target) external view returns(uint256[] memory _exchangeRates) {
-        if (target > exchangeRateQueryLimit) {
-            return _exchangeRates;
+    function _mint(address account, address validator, uint256 amount, address hint) private {
+        // dues protection 
+        if (amount < mintMinLimit) {
+            revert IEarnErrors.EarnMintAmountTooSmall(account, amount);
         }
 
-        if (target < 1) {
-            return _exchangeRates;
-        }
+        _delegateMinted(validator, amount, hint);
 
-        uint256 size = exchangeRates.length;
-        uint256 from = 0;
-        uint256 count;
-        if (target >= size) {
-            count = size;
-        } else {
-            from = size - target;
-            count = target;
-        }
+        // Mint stCORE and send to users
+        uint256 stCore = _exchangeSTCore(amount);
+        ISTCore(STCORE).mint(account, stCore);
 
-        _exchangeRates = new uint256[](count);
-        for (uint256 i = from; i < size; i++) {
-            _exchangeRates[i-from] = exchangeRates[i];
-        }
+        emit Mint(account, amount, stCore);
     }
 
     /**
-     * @dev Returns current latest exchange rate.
+     * @dev Delegates minted CORE to PledgeAgent.
+     * In buffer mode the validator is recorded and CORE is delegated later in a batch.
      */
-    function getCurrentExchangeRate() external view  returns (uint256) {
-        return exchangeRates[exchangeRates.length - 1];
-    } 
+    function _delegateMinted(address validator, uint256 amount, address hint) private {
+        if (mintBufferEnabled) {
+            _bufferDelegate(validator, amount);
+        } else {
+            _delegate(validator, amount, hint);
+        }
+    }
 
     /**
-     * @dev Returns the total amount delegated in {PLEDGE_AGENT} for this contract.
+     * @dev Returns the validator with the least amount delegated by Earn and pending in the buffer,
+     * which can be delegated to as judged by {_canDelegate()}.
+     * New elected validators recorded in {newValidators} are looked at first,
+     * one with nothing pending ends the search.
+     * Delegated validators are linked in ascending order of delegate amounts, so the walk starts from the minimum key
+     * and stops at the first key delegated no less than the best amount found, as pending amounts only add to it.
      */
-    function getTotalDelegateAmount() external view returns (uint256) {
-        uint256 amount = 0;
-        uint256 mapSize = validatorDelegateMap.size();
-        for (uint256 i = 0; i < mapSize; i++) {
-            address key = validatorDelegateMap.getKeyAtIndex(i);
-            amount += validatorDelegateMap.get(key);
+    function _leastDelegatedValidator() private view returns (address leastValidator) {
+        uint256 leastAmount = type(uint256).max;
+        uint256 newValidatorSize = newValidators.length;
+        for (uint256 i = 0; i < newValidatorSize && leastAmount != 0; i++) {
+            address newValidator = newValidators[i];
+            // Validators delegated to since they were recorded are visited in the map
+            if (validatorDelegateMap.exist(newValidator)) {
+                continue;
+            }
+            uint256 amount = pendingDelegations[newValidator];
+            if (amount < leastAmount && _canDelegate(newValidator)) {
+                leastValidator = newValidator;
+                leastAmount = amount;
+            }
         }
-        return amount;
-    }
 
-    /// --- INTERNAL METHODS --- ///
+        address validator = validatorDelegateMap.getMinKey();
+        while (validator != address(0)) {
+            uint256 delegateAmount = validatorDelegateMap.get(validator);
+            if (delegateAmount >= leastAmount) {
+                break;
+            }
+            uint256 amount = delegateAmount + pendingDelegations[validator];
+            if (amount < leastAmount && _canDelegate(validator)) {
+                leastValidator = validator;
+                leastAmount = amount;
+            }
+            validator = validatorDelegateMap.getNextKey(validator);
+        }
+        if (leastValidator == address(0)) {
+            revert IEarnErrors.EarnEmptyValidator();
+        }
+    }
 
     /**
-     * @dev Returns the current round.
-     * Calls {CANDIDATE_HUB.getRoundTag()}.
+     * @dev Burns stCORE of the account for redemption and adds the CORE value to {toWithdrawAmount}.
+     * Returns the amount of CORE the account receives and the protocol fee.
      */
-    function _currentRound() private view returns (uint256) {
-        return ICandidateHub(CANDIDATE_HUB).getRoundTag();
+    function _burnSTCore(address account, uint256 stCore) private returns (uint256 redeemAmount, uint256 protocolFee) {
+        // Dues protection
+        if (stCore < redeemMinLimit) {
+            revert IEarnErrors.EarnSTCoreTooSmall(account, stCore);
+        }
+       
+        uint256 core = _exchangeCore(stCore);
+
+        // Burn stCORE
+        ISTCore(STCORE).burn(account, stCore);
+
+        // Calculate protocol fee
+        protocolFee = core * protocolFeePoints / RATE_BASE;
+        redeemAmount = core - protocolFee;
+
+        toWithdrawAmount += core;
     }
 
     /**
-     * @dev Exchanges core to stCore.
+     * @dev Pops the unlocked redeem records of the account.
+     * Returns the amount of CORE to send to the account and the protocol fee.
      */
-    function _exchangeSTCore(uint256 core) private view returns (uint256) {
-        return core * RATE_BASE / exchangeRates[exchangeRates.length-1];
+    function _popUnlockedRecords(address account) private returns (uint256 accountAmount, uint256 protocolFeeAmount) {
+        RedeemRecordQueue.Queue storage records = redeemQueues[account];
+        while (records.length() != 0) {
+            RedeemRecord memory record = records.front();
+            if (record.unlockTime >= block.timestamp) {
+                break;
+            }
+            accountAmount += record.amount;
+            protocolFeeAmount += record.protocolFee;
+            records.pop();
+        }
     }
 
     /**
-     * @dev Exchanges stCore to core.
+     * @dev Sends the withdrawn CORE to the account and the protocol fee to {protocolFeeReceiver}.
      */
-    function _exchangeCore(uint256 stCore) private view returns(uint256) {
-        return stCore * exchangeRates[exchangeRates.length-1] / RATE_BASE;
+    function _payWithdrawal(address account, uint256 accountAmount, uint256 protocolFeeAmount) private {
+        // Amount of CORE to undelegate
+        uint256 totalAmount = accountAmount + protocolFeeAmount;
+        _prepareWithdrawal(totalAmount);
+
+        // Transfer CORE to user
+        payable(account).sendValue(accountAmount);
+
+        // Transfer CORE to porotocol fee receiver
+        if (protocolFeeAmount != 0) {
+            payable(protocolFeeReceiver).sendValue(protocolFeeAmount);
+        }
+
+        // Update toWithdrawAmount
+        toWithdrawAmount -= totalAmount;
+
+        emit Withdraw(account, accountAmount, protocolFeeAmount);
     }
 
     /**
-     * @dev Exchanges core to stCore.
-     * Undelegate CORE from validators with strategy.
-     * There is dues protection in PledageAgent, which are
-     *   1. Can only delegate 1+ CORE
-     *   2. Can only undelegate 1+ CORE AND can only leave 1+ CORE on validator after undelegate
-     * Internally, Earn delegates/undelegates on validators for each mint/redeem action.
-     * As a result, to make the system solid. Any undelegate action on a validator from Earn must result in
-     *   1. The validator must be cleared or have 1+ CORE remaining after undelegate.
-     *     AND
-     *   2. Earn contract must have 0 or 1+ CORE left to further undelegate.
-     * Otherwise, Earn might fail to undelegate further because of the dues protection from PledgeAgent.
+     * @dev Makes the amount of CORE available in the contract for withdrawals.
+     * The amount is served from CORE held by the contract first, the rest is undelegated from validators.
      */
-    function _unDelegateWithStrategy(uint256 amount) private {
-        // Random validator position
-        uint256 length = validatorDelegateMap.size();
-        if (length == 0) {
-            revert IEarnErrors.EarnEmptyValidator();
+    function _prepareWithdrawal(uint256 amount) private {
+        uint256 liquidAmount = _useLiquidity(amount);
+        if (amount > liquidAmount) {
+            _unDelegateWithStrategy(amount - liquidAmount);
         }
-        uint256 fromIndex = _randomIndex(length);
-
-        bool reachedEnd = false;
-        uint256 index = fromIndex;
-        while(!(index == fromIndex && reachedEnd) && amount > 0) {
-            address key = validatorDelegateMap.getKeyAtIndex(index);
-            uint256 validatorAmount = validatorDelegateMap.get(key);
+    }
 
-            if (validatorAmount > 0) {
-                if (validatorAmount == amount) {
-                    // Case 1: the amount available on the validator == the amount needs to be undelegated
-                    // Undelegate all the tokens from the validator
-                    _unDelegate(key, amount);
-                    amount = 0;
-                    break;
-                } else if (validatorAmount > amount) {
-                    if (validatorAmount >= amount + pledgeAgentLimit) {
-                    // Case 2: the amount available on the validator >= the amount needs to be undelegated + 1
-                    // Undelegate all the tokens from the validator
-                        _unDelegate(key, amount);
-                        amount = 0;
-                        break;
-                    } else {
-                        // Case 3: the amount available on the validator >= the amount needs to be undelegated AND
-                        //          the amount available on the validator <= the amount needs to be undelegated + 1
-                        // In this case we need to make sure there are 1 CORE token left to further undelegate 
-                        uint256 undelegateAmount = amount - pledgeAgentLimit;
-                        if (undelegateAmount > pledgeAgentLimit) {
-                            _unDelegate(key, undelegateAmount);
-                            amount -= undelegateAmount;
-                        }
-                    }
-                } else {
-                    if (amount >= validatorAmount + pledgeAgentLimit) {
-                        // Case 4: the amount available on the validator <= the amount needs to be undelegated - 1
-                        // Clear the validator and move to the next one
-                        _unDelegate(key, validatorAmount);
-                        amount -= validatorAmount;
-                    } else {
-                        // Case 5: the amount available on the validator >= the amount needs to be undelegated - 1 AND
-                        //          the amount available on the validator <= the amount needs to be undelegated
-                        // In this case we need to make sure there are 1 CORE token left on validator 
-                        uint256 undelegateAmount = validatorAmount - pledgeAgentLimit;
-                        if (undelegateAmount > pledgeAgentLimit) {
-                            _unDelegate(key, undelegateAmount);
-                            amount -= undelegateAmount;
-                        }
-                    }
-                }
-            }
+    /**
+     * @dev Serves the amount from {withdrawReserve} first and then from CORE buffered by mint.
+     * Returns the amount served. The rest is either 0 or no less than {pledgeAgentLimit}
+     * so that it can be undelegated from validators.
+     * Withdrawals are only netted against mints of the round in buffer mode, see {mintBufferEnabled}.
+     * Otherwise minted CORE is delegated right away and withdrawals are undelegated from validators.
+     */
+    function _useLiquidity(uint256 amount) private returns (uint256 liquidAmount) {
+        uint256 reserve = withdrawReserve;
+        uint256 liquidity = reserve + pendingDelegateAmount;
+        if (liquidity >= amount) {
+            liquidAmount = amount;
+        } else if (amount - liquidity >= pledgeAgentLimit) {
+            liquidAmount = liquidity;
+        } else if (amount > pledgeAgentLimit) {
+            liquidAmount = amount - pledgeAgentLimit;
+        }
 
-            if (index == length - 1) {
-                index = 0;
-                reachedEnd = true;
-            } else {
-                index++;
-            }
+        if (liquidAmount == 0) {
+            return 0;
         }
 
-        // Earn protocol is insolvency
-        // In theory this could not happen if Earn is funded before open to public
-        if (amount > 0) {
-             revert IEarnErrors.EarnUnDelegateFailedFinally(msg.sender, amount);
+        uint256 reserveAmount = liquidAmount < reserve ? liquidAmount : reserve;
+        if (reserveAmount != 0) {
+            withdrawReserve = (reserve - reserveAmount).toUint120();
+        }
+        if (liquidAmount > reserveAmount) {
+            _takePendingDelegations(liquidAmount - reserveAmount);
         }
     }
 
     /**
-     * @dev Calls {PLEDGE_AGENT} to perform {delegateCoin()} operation.
+     * @dev Takes the amount out of CORE buffered by mint, starting from the latest recorded validator.
      */
-    function _delegate(address validator, uint256 amount) private {
-        IPledgeAgent(PLEDGE_AGENT).delegateCoin{value: amount}(validator);
-        // Update delegate record
-        validatorDelegateMap.add(validator, amount);
-        emit Delegate(validator, amount);
+    function _takePendingDelegations(uint256 amount) private {
+        pendingDelegateAmount -= amount.toUint128();
+        while (amount != 0) {
+            address validator = pendingValidators[pendingValidators.length - 1];
+            uint256 pendingAmount = pendingDelegations[validator];
+            if (pendingAmount > amount) {
+                pendingDelegations[validator] = pendingAmount - amount;
+                amount = 0;
+            } else {
+                delete pendingDelegations[validator];
+                pendingValidators.pop();
+                amount -= pendingAmount;
+            }
+        }
     }
 
     /**
@@ -682,11 +1713,20 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
 
     /**
      * @dev Calls {PLEDGE_AGENT} to perform {claimReward()} operation.
+     * Rewards of all the given validators are claimed in one call.
+     * {PLEDGE_AGENT} limits the number of reward rounds claimed in a call and reports
+     * whether all rewards are claimed, the call is repeated until they are,
+     * so that the exchange rate of the round is calculated on all claimed rewards.
+     * The call is not repeated once the remaining gas falls below {gasReserve}, returns whether all rewards are claimed.
      */
-    function _claim(address validator) private {
-        address[] memory addresses = new address[](1);
-        addresses[0] = validator;
-        IPledgeAgent(PLEDGE_AGENT).claimReward(addresses);
+    function _claim(address[] memory validators, uint256 gasReserve) private returns (bool allClaimed) {
+        if (validators.length == 0) {
+            return true;
+        }
+        (, allClaimed) = IPledgeAgent(PLEDGE_AGENT).claimReward(validators);
+        while (!allClaimed && gasleft() >= gasReserve) {
+            (, allClaimed) = IPledgeAgent(PLEDGE_AGENT).claimReward(validators);
+        }
     }
 
     /**
@@ -708,12 +1748,50 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
         return candidate.status == VALIDATOR_ACTIVE_STATUS;
     }
 
+    /**
+     * @dev Returns whether the validator can be delegated to based on {CANDIDATE_HUB}.
+     * All delegations made by Earn are checked by this method.
+     */
+    function _canDelegate(address validator) private view returns (bool) {
+        return ICandidateHub(CANDIDATE_HUB).canDelegate(validator);
+    }
+
+    /**
+     * @dev Rebalance stakes between the top and bottom validators once.
+     * The function is reused by {reBalance()} and {batchReBalance()}.
+     */
+    function _reBalance() private {
+        if (validatorDelegateMap.size() <= 1) {
+            revert IEarnErrors.EarnEmptyValidator();
+        }
+
+        // Max and min delegate amounts are kept at both ends of the sorted map
+        address maxValidator = validatorDelegateMap.getMaxKey();
+        uint256 max = validatorDelegateMap.get(maxValidator);
+        address minValidator = validatorDelegateMap.getMinKey();
+        uint256 min = validatorDelegateMap.get(minValidator);
+
+        // All validators have the same delegate amount
+        if (max == min) {
+            revert IEarnErrors.EarnReBalanceNoNeed(maxValidator, minValidator);
+        }
+
+        if (max - min < balanceThreshold) {
+            revert IEarnErrors.EarnReBalanceAmountDifferenceLessThanThreshold(maxValidator, minValidator, max, min, balanceThreshold);
+        }
+
+        // Transfer CORE to rebalance
+        uint256 transferAmount = (max - min) / 2;
+
+        _reBalanceTransfer(maxValidator, minValidator, max, transferAmount);
+    }
+
     /**
      * @dev Transfer amount from a validator to another.
      * The funcion is reused by {reBalance()} and {manualReBalance()}.
      */
     function _reBalanceTransfer(address _from, address _to, uint256 _fromAmount, uint256 _transferAmount) private {
-        if (_transferAmount >= pledgeAgentLimit && (_fromAmount ==_transferAmount ||  _fromAmount - _transferAmount >= pledgeAgentLimit)) {
+        if (_isValidReBalanceTransfer(_fromAmount, _transferAmount)) {
             _transfer(_from, _to, _transferAmount);
             emit ReBalance(_from, _to, _transferAmount);
         } else {
@@ -721,6 +1799,14 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
         }
     }
 
+    /**
+     * @dev Both the transfer amount and the amount left on the source validator
+     * must satisfy {pledgeAgentLimit}.
+     */
+    function _isValidReBalanceTransfer(uint256 _fromAmount, uint256 _transferAmount) private view returns (bool) {
+        return _transferAmount >= pledgeAgentLimit && (_fromAmount ==_transferAmount ||  _fromAmount - _transferAmount >= pledgeAgentLimit);
+    }
+
     /// --- ADMIN OPERATIONS --- ///
 
     /**
@@ -756,7 +1842,7 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
         if (_mintMinLimit < 1 ether) {
             revert IEarnErrors.EarnMintMinLimitMustGreaterThan1Core();
         }
-        mintMinLimit = _mintMinLimit;
+        mintMinLimit = _mintMinLimit.toUint72();
         emit UpdateMintMinLimit(msg.sender, _mintMinLimit);
     }
 
@@ -774,7 +1860,7 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
         if (_redeemMinLimit < 1 ether) {
             revert IEarnErrors.EarnRedeemMinLimitMustGreaterThan1Core();
         }
-        redeemMinLimit = _redeemMinLimit;
+        redeemMinLimit = _redeemMinLimit.toUint72();
         emit UpdateRedeemMinLimit(msg.sender, _redeemMinLimit);
     }
 
@@ -809,7 +1895,7 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
         if (_lockDay == 0) {
             revert IEarnErrors.EarnLockDayMustGreaterThanZero();
         }
-        lockDay = _lockDay;
+        lockDay = _lockDay.toUint24();
         emit UpdateLockDay(msg.sender, _lockDay);
     }
 
@@ -826,7 +1912,7 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
         if (_protocolFeePoints > RATE_BASE) {
             revert IEarnErrors.EarnProtocolFeePointMoreThanRateBase(_protocolFeePoints);
         }
-        protocolFeePoints = _protocolFeePoints;
+        protocolFeePoints = _protocolFeePoints.toUint24();
         emit UpdateProtocolFeePoints(msg.sender, _protocolFeePoints);
     }
 
@@ -879,7 +1965,7 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
         if (_redeemCountLimit == 0) {
             revert IEarnErrors.EarnRedeemCountLimitMustGreaterThanZero();
         }
-        redeemCountLimit = _redeemCountLimit;
+        redeemCountLimit = _redeemCountLimit.toUint24();
         emit UpdateRedeemCountLimit(msg.sender, _redeemCountLimit);
     }
 
@@ -900,6 +1986,54 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
         emit UpdateExchangeRateQueryLimit(msg.sender, _exchangeRateQueryLimit);
     }
 
+    /**
+     * @dev Enables or disables the mint buffer.
+     * If enabled, minted CORE is delegated in batches instead of on each mint.
+     * CORE already buffered is still delegated after the buffer is disabled.
+     *
+     * Emits an {UpdateMintBufferEnabled} event.
+     *
+     * Requirements:
+     *
+     * - The caller must be owner.
+     */
+    function updateMintBufferEnabled(bool _mintBufferEnabled) external onlyOwner {
+        mintBufferEnabled = _mintBufferEnabled;
+        emit UpdateMintBufferEnabled(msg.sender, _mintBufferEnabled);
+    }
+
+    /**
+     * @dev Updates the number of validators with the least delegate amounts
+     * which share rewards reinvested in {afterTurnRound()}.
+     * Set to 0 to delegate rewards to a randomly chosen validator.
+     *
+     * Emits an {UpdateReinvestValidatorCount} event.
+     *
+     * Requirements:
+     *
+     * - The caller must be owner.
+     */
+    function updateReinvestValidatorCount(uint256 _reinvestValidatorCount) external onlyOwner {
+        reinvestValidatorCount = _reinvestValidatorCount.toUint8();
+        emit UpdateReinvestValidatorCount(msg.sender, _reinvestValidatorCount);
+    }
+
+    /**
+     * @dev Updates the upper bound of CORE kept from rewards claimed in {afterTurnRound()} to serve withdrawals
+     * in buffer mode. Set to 0 to reinvest all rewards.
+     * If the bound is lowered, CORE already kept is still used by withdrawals first.
+     *
+     * Emits an {UpdateWithdrawReserveLimit} event.
+     *
+     * Requirements:
+     *
+     * - The caller must be owner.
+     */
+    function updateWithdrawReserveLimit(uint256 _withdrawReserveLimit) external onlyOwner {
+        withdrawReserveLimit = _withdrawReserveLimit.toUint120();
+        emit UpdateWithdrawReserveLimit(msg.sender, _withdrawReserveLimit);
+    }
+
     /**
      * @dev Triggers stopped state.
      *
@@ -940,5 +2074,5 @@ contract Earn is Initializable, Ownable2StepUpgradeable, ReentrancyGuardUpgradea
      * variables without shifting down storage in the inheritance chain.
      * See https://docs.openzeppelin.com/contracts/4.x/upgradeable#storage_gaps
      */
-    uint256[50] private __gap;
+    uint256[29] private __gap;
 }
\ No newline at end of file
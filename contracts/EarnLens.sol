@@ -0,0 +1,54 @@
+// SPDX-License-Identifier: Apache2.0
+pragma solidity 0.8.4;
+
+import "./interface/IEarn.sol";
+import "./lib/Structs.sol";
+
+import "@openzeppelin/contracts/token/ERC20/IERC20.sol";
+
+/**
+ * @dev Read only helper which collects the state of an Earn contract,
+ * so that frontends and bots get it in a single call instead of one call per field.
+ */
+contract EarnLens {
+    /**
+     * @dev Returns the global state of Earn and the state of the account.
+     */
+    function getState(address earn, address account) external view returns (EarnState memory state, EarnAccountState memory accountState) {
+        state = _getState(IEarn(earn));
+        accountState = _getAccountState(IEarn(earn), account);
+    }
+
+    /**
+     * @dev Returns the state of each given account.
+     */
+    function getAccountStates(address earn, address[] calldata accounts) external view returns (EarnAccountState[] memory accountStates) {
+        accountStates = new EarnAccountState[](accounts.length);
+        for (uint256 i = 0; i < accounts.length; i++) {
+            accountStates[i] = _getAccountState(IEarn(earn), accounts[i]);
+        }
+    }
+
+    function _getState(IEarn earn) private view returns (EarnState memory state) {
+        state.roundTag = earn.roundTag();
+        state.exchangeRate = earn.getCurrentExchangeRate();
+        state.totalDelegateAmount = earn.getTotalDelegateAmount();
+        state.pendingDelegateAmount = earn.pendingDelegateAmount();
+        state.withdrawReserve = earn.withdrawReserve();
+        state.toWithdrawAmount = earn.toWithdrawAmount();
+        state.stCoreTotalSupply = IERC20(earn.STCORE()).totalSupply();
+        state.lockDay = earn.lockDay();
+        state.mintMinLimit = earn.mintMinLimit();
+        state.redeemMinLimit = earn.redeemMinLimit();
+        state.pledgeAgentLimit = earn.pledgeAgentLimit();
+        state.protocolFeePoints = earn.protocolFeePoints();
+        state.redeemCountLimit = earn.redeemCountLimit();
+        state.paused = earn.paused();
+        state.mintBufferEnabled = earn.mintBufferEnabled();
+    }
+
+    function _getAccountState(IEarn earn, address account) private view returns (EarnAccountState memory accountState) {
+        accountState.stCoreBalance = IERC20(earn.STCORE()).balanceOf(account);
+        (accountState.unlockedAmount, accountState.lockedAmount) = earn.getRedeemAmount(account);
+    }
+}
@@ -0,0 +1,21 @@
+// SPDX-License-Identifier: MIT
+pragma solidity 0.8.4;
+
+interface IEarn {
+    function STCORE() external view returns (address);
+    function roundTag() external view returns (uint32);
+    function paused() external view returns (bool);
+    function getCurrentExchangeRate() external view returns (uint256);
+    function getTotalDelegateAmount() external view returns (uint256);
+    function getRedeemAmount(address account) external view returns (uint256 unlockedAmount, uint256 lockedAmount);
+    function pendingDelegateAmount() external view returns (uint128);
+    function withdrawReserve() external view returns (uint120);
+    function toWithdrawAmount() external view returns (uint256);
+    function lockDay() external view returns (uint24);
+    function mintMinLimit() external view returns (uint72);
+    function redeemMinLimit() external view returns (uint72);
+    function pledgeAgentLimit() external view returns (uint256);
+    function protocolFeePoints() external view returns (uint24);
+    function redeemCountLimit() external view returns (uint24);
+    function mintBufferEnabled() external view returns (bool);
+}
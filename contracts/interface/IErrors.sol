@@ -30,6 +30,9 @@ interface IEarnErrors {
     error EarnZeroValidator(address validator);
     error EarnMintAmountTooSmall(address account, uint256 amount);
     error EarnCallStCoreMintFailed(address account, uint256 amount, uint256 stCore);
+    error EarnMintBatchEmpty();
+    error EarnMintBatchLengthMismatch(uint256 recipientCount, uint256 amountCount);
+    error EarnMintBatchValueMismatch(uint256 value, uint256 totalAmount);
 
     // redeem related errors
     error EarnSTCoreTooSmall(address account, uint256 stCore);
@@ -42,9 +45,20 @@ interface IEarnErrors {
     error EarnEmptyRedeemRecord();
     error EarnRedeemRecordNotFound(address account);
     error EarnInsufficientBalance(uint256 balance, uint256 amount);
+    error EarnWithdrawForNoUnlockedRecord();
+    error EarnRedeemCommitmentMismatch(address account);
+    error EarnNoWithdrawalRequestToFinalize();
+    error EarnWithdrawalRequestNotFinalized(uint256 requestId);
+    error EarnWithdrawalRequestNotOwned(address account, uint256 requestId);
 
     // after turn round related errors
     error EarnValidatorsAllOffline();
+    error EarnPageSizeMustGreaterThanZero();
+
+    // exchange rate query related errors
+    error EarnExchangeRateNotFound(uint256 round);
+    error EarnExchangeRateIndexNotFound(uint256 index);
+    error EarnInvalidRoundRange(uint256 fromRound, uint256 toRound);
 }
 
 interface ISTCoreErrors {
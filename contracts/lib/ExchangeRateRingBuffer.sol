@@ -0,0 +1,85 @@
+// SPDX-License-Identifier: Apache2.0
+pragma solidity 0.8.4;
+
+import "@openzeppelin/contracts/utils/math/SafeCast.sol";
+
+library ExchangeRateRingBuffer {
+    using SafeCast for uint256;
+
+    // Maximum number of entries kept, the oldest entry is overwritten when the buffer is full
+    uint256 internal constant CAPACITY = 1024;
+
+    // An entry takes 128 bits: round in the high 32 bits and rate in the low 96 bits
+    // Two entries are packed into one slot
+    struct Buffer {
+        uint256 count;
+        mapping(uint256 => uint256) slots;
+    }
+
+    function length(Buffer storage buffer) internal view returns (uint256) {
+        return buffer.count < CAPACITY ? buffer.count : CAPACITY;
+    }
+
+    function push(Buffer storage buffer, uint256 round, uint256 rate) internal {
+        uint256 entry = (uint256(round.toUint32()) << 96) | rate.toUint96();
+        uint256 position = buffer.count % CAPACITY;
+        uint256 shift = (position % 2) * 128;
+        uint256 slot = buffer.slots[position / 2];
+        slot = (slot & ~(uint256(type(uint128).max) << shift)) | (entry << shift);
+        buffer.slots[position / 2] = slot;
+        buffer.count++;
+    }
+
+    /**
+     * @dev Counts {count} entries as pushed and already overwritten without recording them.
+     * Only used on an empty buffer, so that the latest entries of a longer history keep their positions.
+     */
+    function skip(Buffer storage buffer, uint256 count) internal {
+        buffer.count += count;
+    }
+
+    /**
+     * @dev Returns the entry at {position} counted from the first entry ever pushed, including overwritten entries.
+     * Returns false if the entry is overwritten or not pushed yet.
+     */
+    function atPosition(Buffer storage buffer, uint256 position) internal view returns (bool found, uint256 round, uint256 rate) {
+        uint256 first = buffer.count - length(buffer);
+        if (position < first || position >= buffer.count) {
+            return (false, 0, 0);
+        }
+        (round, rate) = at(buffer, position - first);
+        return (true, round, rate);
+    }
+
+    /**
+     * @dev Returns the entry at {index}, index 0 is the oldest entry kept.
+     */
+    function at(Buffer storage buffer, uint256 index) internal view returns (uint256 round, uint256 rate) {
+        uint256 position = (buffer.count - length(buffer) + index) % CAPACITY;
+        uint256 entry = (buffer.slots[position / 2] >> ((position % 2) * 128)) & type(uint128).max;
+        round = entry >> 96;
+        rate = entry & type(uint96).max;
+    }
+
+    /**
+     * @dev Returns the index of the latest entry recorded at or before {round} by binary search.
+     * Entries are pushed in non-decreasing round order.
+     */
+    function findIndex(Buffer storage buffer, uint256 round) internal view returns (bool found, uint256 index) {
+        uint256 low = 0;
+        uint256 high = length(buffer);
+        while (low < high) {
+            uint256 mid = (low + high) / 2;
+            (uint256 midRound, ) = at(buffer, mid);
+            if (midRound <= round) {
+                low = mid + 1;
+            } else {
+                high = mid;
+            }
+        }
+        if (low == 0) {
+            return (false, 0);
+        }
+        return (true, low - 1);
+    }
+}
@@ -6,6 +6,23 @@ library IterableAddressDelegateMapping {
         address[] keys;
         mapping(address => uint256) values;
         mapping(address => uint) indexOf;
+        // Sum of all values in the map
+        uint256 total;
+        // Keys are linked in ascending order of values
+        mapping(address => address) prev;
+        mapping(address => address) next;
+        // Key with the minimum value
+        address head;
+        // Key with the maximum value
+        address tail;
+    }
+
+    // Layout of {Map} before {Map.total} was introduced
+    // Only used to migrate existing storage
+    struct LegacyMap {
+        address[] keys;
+        mapping(address => uint256) values;
+        mapping(address => uint) indexOf;
     }
 
     function get(Map storage map, address key) internal view returns (uint256) {
@@ -16,24 +33,64 @@ library IterableAddressDelegateMapping {
         return map.keys[index];
     }
 
+    function getTotal(Map storage map) internal view returns (uint256) {
+        return map.total;
+    }
+
     function size(Map storage map) internal view returns (uint) {
         return map.keys.length;
     }
 
+    function getMinKey(Map storage map) internal view returns (address) {
+        return map.head;
+    }
+
+    function getMaxKey(Map storage map) internal view returns (address) {
+        return map.tail;
+    }
+
+    function getNextKey(Map storage map, address key) internal view returns (address) {
+        return map.next[key];
+    }
+
+    function getPrevKey(Map storage map, address key) internal view returns (address) {
+        return map.prev[key];
+    }
 
     function add(Map storage map, address key, uint256 val) internal {
+        add(map, key, val, address(0));
+    }
+
+    /**
+     * @dev Adds {val} to the value of the key.
+     * {hint} is the key expected right before {key} once the value is updated, address(0) for no hint.
+     * A correct hint is verified and used in constant gas, otherwise the key walks to its position.
+     */
+    function add(Map storage map, address key, uint256 val, address hint) internal {
         if (map.indexOf[key] != 0) {
             map.values[key] += val;
         } else {
             map.values[key] = val;
             map.keys.push(key);
             map.indexOf[key] = map.keys.length;
+            _link(map, key, address(0), map.head);
         }
+        map.total += val;
+        _reposition(map, key, hint);
     }
 
     function subtract(Map storage map, address key, uint256 val) internal {
+        subtract(map, key, val, address(0));
+    }
+
+    /**
+     * @dev Subtracts {val} from the value of the key, {hint} is used as in {add}.
+     */
+    function subtract(Map storage map, address key, uint256 val, address hint) internal {
         if (map.indexOf[key] != 0) {
              map.values[key] -= val;
+             map.total -= val;
+             _reposition(map, key, hint);
         } 
     }
 
@@ -42,6 +99,7 @@ library IterableAddressDelegateMapping {
             return;
         }
 
+        map.total -= map.values[key];
         delete map.values[key];
 
         uint indexPlus1 = map.indexOf[key];
@@ -52,9 +110,110 @@ library IterableAddressDelegateMapping {
         }
         delete map.indexOf[key];
         map.keys.pop();
+        _unlink(map, key);
     }
 
     function exist(Map storage map, address key) view internal returns(bool) {
         return map.indexOf[key] != 0;
     } 
+
+    /**
+     * @dev Returns the hint for {add} or {subtract} which places the key with value {val}, address(0) if
+     * the key goes to the head of the list.
+     * The list is walked from the head, so it is meant to be called off-chain.
+     */
+    function findHint(Map storage map, address key, uint256 val) internal view returns (address hint) {
+        address current = map.head;
+        while (current != address(0)) {
+            if (current != key) {
+                if (map.values[current] >= val) {
+                    break;
+                }
+                hint = current;
+            }
+            current = map.next[current];
+        }
+    }
+
+    /**
+     * @dev Moves the key after its value changes to keep keys in ascending order.
+     * If {hint} is a valid key to put before {key}, the key is linked after it directly.
+     * Otherwise the walk starts from the current position of the key, so its cost is bounded by the number of keys it passes.
+     */
+    function _reposition(Map storage map, address key, address hint) private {
+        uint256 val = map.values[key];
+        if (hint != address(0) && hint != key && map.indexOf[hint] != 0 && map.values[hint] <= val) {
+            address hintNext = map.next[hint];
+            if (hintNext == key) {
+                hintNext = map.next[key];
+            }
+            if (hintNext == address(0) || map.values[hintNext] >= val) {
+                if (map.prev[key] != hint) {
+                    _unlink(map, key);
+                    _link(map, key, hint, map.next[hint]);
+                }
+                return;
+            }
+        }
+
+        address prevKey = map.prev[key];
+        address nextKey = map.next[key];
+
+        if (nextKey != address(0) && map.values[nextKey] < val) {
+            // Value increased, move towards tail
+            _unlink(map, key);
+            prevKey = nextKey;
+            nextKey = map.next[prevKey];
+            while (nextKey != address(0) && map.values[nextKey] < val) {
+                prevKey = nextKey;
+                nextKey = map.next[nextKey];
+            }
+            _link(map, key, prevKey, nextKey);
+        } else if (prevKey != address(0) && map.values[prevKey] > val) {
+            // Value decreased, move towards head
+            _unlink(map, key);
+            nextKey = prevKey;
+            prevKey = map.prev[nextKey];
+            while (prevKey != address(0) && map.values[prevKey] > val) {
+                nextKey = prevKey;
+                prevKey = map.prev[prevKey];
+            }
+            _link(map, key, prevKey, nextKey);
+        }
+    }
+
+    /**
+     * @dev Links the key between {prevKey} and {nextKey}, address(0) stands for the end of the list.
+     */
+    function _link(Map storage map, address key, address prevKey, address nextKey) private {
+        map.prev[key] = prevKey;
+        map.next[key] = nextKey;
+        if (prevKey == address(0)) {
+            map.head = key;
+        } else {
+            map.next[prevKey] = key;
+        }
+        if (nextKey == address(0)) {
+            map.tail = key;
+        } else {
+            map.prev[nextKey] = key;
+        }
+    }
+
+    function _unlink(Map storage map, address key) private {
+        address prevKey = map.prev[key];
+        address nextKey = map.next[key];
+        if (prevKey == address(0)) {
+            map.head = nextKey;
+        } else {
+            map.next[prevKey] = nextKey;
+        }
+        if (nextKey == address(0)) {
+            map.tail = prevKey;
+        } else {
+            map.prev[nextKey] = prevKey;
+        }
+        delete map.prev[key];
+        delete map.next[key];
+    }
 }
\ No newline at end of file
@@ -0,0 +1,139 @@
+// SPDX-License-Identifier: Apache2.0
+pragma solidity 0.8.4;
+
+import "./Structs.sol";
+
+import "@openzeppelin/contracts/utils/math/SafeCast.sol";
+
+library RedeemRecordQueue {
+    using SafeCast for uint256;
+
+    struct Queue {
+        uint128 head;
+        uint128 tail;
+        // Running totals of record amounts pushed to and popped from the queue
+        uint128 pushedAmount;
+        uint128 poppedAmount;
+        mapping(uint256 => PackedRedeemRecord) records;
+    }
+
+    function length(Queue storage queue) internal view returns (uint256) {
+        return queue.tail - queue.head;
+    }
+
+    function at(Queue storage queue, uint256 index) internal view returns (RedeemRecord memory) {
+        return _unpack(queue, queue.head + index);
+    }
+
+    function front(Queue storage queue) internal view returns (RedeemRecord memory) {
+        return _unpack(queue, queue.head);
+    }
+
+    /**
+     * @dev Returns the sum of amounts of all records in the queue.
+     */
+    function totalAmount(Queue storage queue) internal view returns (uint256) {
+        return queue.pushedAmount - queue.poppedAmount;
+    }
+
+    /**
+     * @dev Returns the number of records unlocked before {timestamp}.
+     * Unlock times are non-decreasing along the queue, so unlocked records are found by binary search.
+     */
+    function unlockedLength(Queue storage queue, uint256 timestamp) internal view returns (uint256) {
+        uint256 low = queue.head;
+        uint256 high = queue.tail;
+        while (low < high) {
+            uint256 mid = (low + high) / 2;
+            if (queue.records[mid].unlockTime < timestamp) {
+                low = mid + 1;
+            } else {
+                high = mid;
+            }
+        }
+        return low - queue.head;
+    }
+
+    /**
+     * @dev Returns the sum of amounts of records unlocked before {timestamp}.
+     */
+    function unlockedAmount(Queue storage queue, uint256 timestamp) internal view returns (uint256) {
+        uint256 count = unlockedLength(queue, timestamp);
+        if (count == 0) {
+            return 0;
+        }
+        return queue.records[queue.head + count - 1].cumulativeAmount - queue.poppedAmount;
+    }
+
+    /**
+     * @dev Appends the record to the queue.
+     * Records are kept in order of unlock time, a record unlocking earlier than the last records,
+     * e.g. after the lock period is shortened, is inserted before them.
+     */
+    function push(Queue storage queue, RedeemRecord memory record) internal {
+        uint128 amount = record.amount.toUint128();
+        uint256 position = queue.tail;
+        while (position != queue.head && queue.records[position - 1].unlockTime > record.unlockTime) {
+            PackedRedeemRecord memory moved = queue.records[position - 1];
+            moved.cumulativeAmount += amount;
+            queue.records[position] = moved;
+            position--;
+        }
+
+        uint128 previousAmount = position == queue.head ? queue.poppedAmount : queue.records[position - 1].cumulativeAmount;
+        queue.records[position] = PackedRedeemRecord({
+            redeemTime: record.redeemTime.toUint64(),
+            unlockTime: record.unlockTime.toUint64(),
+            cumulativeAmount: previousAmount + amount,
+            stCore: record.stCore.toUint128(),
+            protocolFee: record.protocolFee.toUint128()
+        });
+        queue.pushedAmount += amount;
+        queue.tail++;
+    }
+
+    /**
+     * @dev Adds the record to the last record of the queue if both unlock in the same period of {interval} seconds.
+     * The merged record unlocks at the later of the two unlock times.
+     * Returns false if the queue is empty or the record unlocks in another period.
+     */
+    function merge(Queue storage queue, RedeemRecord memory record, uint256 interval) internal returns (bool) {
+        uint256 tail = queue.tail;
+        if (tail == queue.head) {
+            return false;
+        }
+        PackedRedeemRecord storage last = queue.records[tail - 1];
+        if (last.unlockTime / interval != record.unlockTime / interval) {
+            return false;
+        }
+
+        if (record.unlockTime > last.unlockTime) {
+            last.unlockTime = record.unlockTime.toUint64();
+        }
+        uint128 cumulativeAmount = queue.pushedAmount + record.amount.toUint128();
+        last.cumulativeAmount = cumulativeAmount;
+        last.stCore += record.stCore.toUint128();
+        last.protocolFee += record.protocolFee.toUint128();
+        queue.pushedAmount = cumulativeAmount;
+        return true;
+    }
+
+    function pop(Queue storage queue) internal {
+        uint256 head = queue.head;
+        queue.poppedAmount = queue.records[head].cumulativeAmount;
+        delete queue.records[head];
+        queue.head++;
+    }
+
+    function _unpack(Queue storage queue, uint256 position) private view returns (RedeemRecord memory) {
+        PackedRedeemRecord memory packed = queue.records[position];
+        uint256 previousAmount = position == queue.head ? queue.poppedAmount : queue.records[position - 1].cumulativeAmount;
+        return RedeemRecord({
+            redeemTime: packed.redeemTime,
+            unlockTime: packed.unlockTime,
+            amount: packed.cumulativeAmount - previousAmount,
+            stCore: packed.stCore,
+            protocolFee: packed.protocolFee
+        });
+    }
+}
@@ -18,6 +18,40 @@ struct RedeemRecord {
     uint256 protocolFee;
 }
 
+// Storage representation of {RedeemRecord}
+// Timestamps fit in uint64 and CORE amounts fit in uint128, so a record takes 2 slots instead of 5
+// The amount is kept as the running total of amounts pushed to the queue up to and including the record
+struct PackedRedeemRecord {
+    uint64 redeemTime;
+    uint64 unlockTime;
+    uint128 cumulativeAmount;
+    uint128 stCore;
+    uint128 protocolFee;
+}
+
+// Commitment to the redeem records of an account in storage-light mode
+// Records are kept off-chain and passed in as calldata on withdrawal
+struct RedeemCommitment {
+    // Hash chain over the outstanding records in redemption order
+    bytes32 hash;
+
+    // Sum of amounts of the outstanding records
+    uint128 amount;
+
+    // Number of the outstanding records
+    uint128 count;
+}
+
+// Storage representation of a redemption in the protocol-wide withdrawal queue
+// Amounts are kept as running totals over all requests up to and including the request
+// {account} is cleared once the request is claimed
+struct WithdrawalRequest {
+    address account;
+    uint64 unlockTime;
+    uint128 cumulativeAmount;
+    uint128 cumulativeProtocolFee;
+}
+
 // Definition from CandidateHub
 struct Candidate {
     address operateAddr;
@@ -28,4 +62,35 @@ struct Candidate {
     uint256 status;
     uint256 commissionLastChangeRound;
     uint256 commissionLastRoundValue;
-}
\ No newline at end of file
+}
+
+// Global state of Earn returned by {EarnLens} in a single call
+struct EarnState {
+    uint256 roundTag;
+    uint256 exchangeRate;
+    uint256 totalDelegateAmount;
+    uint256 pendingDelegateAmount;
+    uint256 withdrawReserve;
+    uint256 toWithdrawAmount;
+    uint256 stCoreTotalSupply;
+    uint256 lockDay;
+    uint256 mintMinLimit;
+    uint256 redeemMinLimit;
+    uint256 pledgeAgentLimit;
+    uint256 protocolFeePoints;
+    uint256 redeemCountLimit;
+    bool paused;
+    bool mintBufferEnabled;
+}
+
+// State of an account in Earn returned by {EarnLens} in a single call
+struct EarnAccountState {
+    // Amount of stCORE held
+    uint256 stCoreBalance;
+
+    // Amount of redeemed CORE which can be withdrawn
+    uint256 unlockedAmount;
+
+    // Amount of redeemed CORE still locked
+    uint256 lockedAmount;
+}
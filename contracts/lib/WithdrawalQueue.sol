@@ -0,0 +1,82 @@
+// SPDX-License-Identifier: Apache2.0
+pragma solidity 0.8.4;
+
+import "./Structs.sol";
+
+import "@openzeppelin/contracts/utils/math/SafeCast.sol";
+
+/**
+ * @dev Protocol-wide queue of withdrawal requests.
+ * Requests get sequential ids starting from 1 and keep running totals of amounts,
+ * so the amount of any range of requests is the difference of two totals.
+ * Requests up to {finalizedId} have CORE set aside and can be claimed in any order.
+ */
+library WithdrawalQueue {
+    using SafeCast for uint256;
+
+    struct Queue {
+        uint64 lastId;
+        uint64 finalizedId;
+        mapping(uint256 => WithdrawalRequest) requests;
+    }
+
+    /**
+     * @dev Appends a request and returns its id.
+     * Requests are finalized in order, so the unlock time is raised to the one of the previous request if needed.
+     */
+    function push(Queue storage queue, address account, uint256 unlockTime, uint256 amount, uint256 protocolFee) internal returns (uint256 id) {
+        WithdrawalRequest storage previous = queue.requests[queue.lastId];
+        if (previous.unlockTime > unlockTime) {
+            unlockTime = previous.unlockTime;
+        }
+
+        id = queue.lastId + 1;
+        queue.requests[id] = WithdrawalRequest({
+            account: account,
+            unlockTime: unlockTime.toUint64(),
+            cumulativeAmount: previous.cumulativeAmount + amount.toUint128(),
+            cumulativeProtocolFee: previous.cumulativeProtocolFee + protocolFee.toUint128()
+        });
+        queue.lastId = id.toUint64();
+    }
+
+    /**
+     * @dev Returns the id of the last request unlocked before {timestamp},
+     * looking at no more than {maxCount} requests after {finalizedId}.
+     */
+    function lastUnlockedId(Queue storage queue, uint256 timestamp, uint256 maxCount) internal view returns (uint256) {
+        uint256 low = queue.finalizedId;
+        uint256 high = queue.lastId;
+        if (high - low > maxCount) {
+            high = low + maxCount;
+        }
+        while (low < high) {
+            uint256 mid = (low + high + 1) / 2;
+            if (queue.requests[mid].unlockTime < timestamp) {
+                low = mid;
+            } else {
+                high = mid - 1;
+            }
+        }
+        return low;
+    }
+
+    /**
+     * @dev Marks requests up to {id} as finalized.
+     * Returns the amount of CORE and the protocol fee of the newly finalized requests.
+     */
+    function finalize(Queue storage queue, uint256 id) internal returns (uint256 amount, uint256 protocolFee) {
+        WithdrawalRequest storage from = queue.requests[queue.finalizedId];
+        WithdrawalRequest storage to = queue.requests[id];
+        amount = to.cumulativeAmount - from.cumulativeAmount;
+        protocolFee = to.cumulativeProtocolFee - from.cumulativeProtocolFee;
+        queue.finalizedId = id.toUint64();
+    }
+
+    /**
+     * @dev Returns the amount of CORE the account receives for the request.
+     */
+    function amountOf(Queue storage queue, uint256 id) internal view returns (uint256) {
+        return queue.requests[id].cumulativeAmount - queue.requests[id - 1].cumulativeAmount;
+    }
+}